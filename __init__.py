@@ -1,2 +1,3 @@
-from .kle_placer_action import KLEPlacerAction # Note the relative import!
+# Only the light action plugin class is imported here, everything else is imported when the plugin is run
+from .action_plugin import KLEPlacerAction # Note the relative import!
 KLEPlacerAction().register() # Instantiate and register to Pcbnew
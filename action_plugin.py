@@ -0,0 +1,16 @@
+import pcbnew
+
+class KLEPlacerAction(pcbnew.ActionPlugin):
+    """Registered with KiCad when the PCB editor starts, so only imports what registering needs (pcbnew is already loaded by then).
+    The dialog, parser and placer (and wx, numpy...) are imported the first time the button is pressed, see `kle_placer_action`.
+    """
+    def defaults(self):
+        self.name = "KLE Placer"
+        self.category = "Utility"
+        self.description = "Places switches down in a kicad project based on "
+        self.show_toolbar_button = True # Optional, defaults to False
+        # self.icon_file_name = os.path.join(os.path.dirname(__file__), 'icon.png') # Optional
+
+    def Run(self):
+        from .kle_placer_action import KLEPlacerRun
+        KLEPlacerRun().Run()
@@ -0,0 +1,25 @@
+"""Benchmarks `serial.deserialize` against the previous deepcopy based implementation.
+
+Run with `python benchmarks/bench_deserialize.py`.
+"""
+from copy import deepcopy
+
+from common import import_module, best_of
+from generators import generate_rows
+import legacy_serial
+
+serial = import_module("serial")
+
+def main():
+    print("{:>8} {:>12} {:>12} {:>8}".format("keys", "legacy (ms)", "current (ms)", "speedup"))
+    for keys in (100, 1000, 10000):
+        rows = generate_rows(keys)
+        if serial.deserialize(deepcopy(rows)) != legacy_serial.deserialize(deepcopy(rows)):
+            raise AssertionError("deserialize output differs from the legacy implementation for {} keys".format(keys))
+
+        legacy = best_of(lambda: legacy_serial.deserialize(rows))
+        current = best_of(lambda: serial.deserialize(rows))
+        print("{:>8} {:>12.2f} {:>12.2f} {:>7.1f}x".format(keys, legacy * 1000, current * 1000, legacy / current))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Compares copying a parsed layout with `deepcopy` (what the placer used to do) against converting it
+to compact `layout.PlacerKey`s, in time and memory.
+
+Run with `python benchmarks/bench_layout.py`.
+"""
+import tracemalloc
+from copy import deepcopy
+
+from common import import_module, best_of
+from generators import generate_rows
+
+serial = import_module("serial")
+layout = import_module("layout")
+
+def allocated(func) -> int:
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+def main():
+    print("{:>8} {:>14} {:>14} {:>14} {:>14}".format("keys", "deepcopy (ms)", "compact (ms)", "deepcopy (kB)", "compact (kB)"))
+    for keys in (100, 1000, 10000):
+        kbd = serial.deserialize(generate_rows(keys))
+        copy_time = best_of(lambda: deepcopy(kbd.keys))
+        compact_time = best_of(lambda: layout.to_placer_keys(kbd.keys))
+        copy_size = allocated(lambda: deepcopy(kbd.keys))
+        compact_size = allocated(lambda: layout.to_placer_keys(kbd.keys))
+        print("{:>8} {:>14.2f} {:>14.2f} {:>14.0f} {:>14.0f}".format(
+            keys, copy_time * 1000, compact_time * 1000, copy_size / 1024, compact_size / 1024))
+
+if __name__ == "__main__":
+    main()
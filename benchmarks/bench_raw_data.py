@@ -0,0 +1,34 @@
+"""Benchmarks parsing KLE raw data (`raw_data.parse_raw_data`) against `json.loads` of the json download of the same layout,
+in MB of layout text per second, and loading either (`util.parse_layout`, which also deserializes the rows) end to end.
+
+Run with `python benchmarks/bench_raw_data.py`.
+"""
+import json
+
+from common import import_module, best_of
+from generators import generate_rows, raw_data
+
+raw_data_module = import_module("raw_data")
+util = import_module("util")
+
+def main():
+    print("{:>8} {:>10} {:>12} {:>12} {:>12} {:>15} {:>15}".format("keys", "size (MB)", "json (MB/s)", "raw (MB/s)", "raw / json",
+                                                               "load json (ms)", "load raw (ms)"))
+    for keys in (1000, 10000, 100000):
+        rows = generate_rows(keys)
+        json_text = json.dumps(rows)
+        raw_text = raw_data(rows)
+        if raw_data_module.layout_rows(raw_text) != rows or raw_data_module.layout_rows(json_text) != rows:
+            raise AssertionError("raw data and json download parse differently for {} keys".format(keys))
+
+        megabytes = len(raw_text.encode("utf-8")) / 1e6
+        json_time = best_of(lambda: json.loads(json_text))
+        raw_time = best_of(lambda: raw_data_module.parse_raw_data(raw_text))
+        json_mb = len(json_text.encode("utf-8")) / 1e6
+        load_json = best_of(lambda: util.parse_layout(json_text))
+        load_raw = best_of(lambda: util.parse_layout(raw_text))
+        print("{:>8} {:>10.2f} {:>12.1f} {:>12.1f} {:>11.2f}x {:>15.1f} {:>15.1f}".format(keys, megabytes, json_mb / json_time, megabytes / raw_time,
+                                                                                    json_time / raw_time, load_json * 1000, load_raw * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measures what loading the plugin costs when KiCad starts the PCB editor: importing the package and registering
+the action plugin, against importing the modules registration used to pull in (the dialog, parser and placer).
+
+Every measurement runs in a fresh interpreter, with `fake_pcbnew` standing in for pcbnew (already loaded in KiCad).
+wx is only included in the eager imports if it is installed.
+
+Run with `python benchmarks/bench_startup.py`.
+"""
+import os
+import sys
+import subprocess
+
+from common import ROOT, PACKAGE
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPEAT = 10
+
+SETUP = """
+import sys, time, importlib, importlib.util
+sys.path.insert(0, {benchmarks!r})
+import fake_pcbnew
+sys.modules["pcbnew"] = fake_pcbnew
+start = time.perf_counter()
+"""
+
+# Importing the package runs __init__.py, which registers the action plugin
+REGISTER = SETUP + """
+spec = importlib.util.spec_from_file_location({package!r}, {init!r}, submodule_search_locations=[{root!r}])
+package = importlib.util.module_from_spec(spec)
+sys.modules[{package!r}] = package
+spec.loader.exec_module(package)
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+# What registering used to import: the dialog module and everything it imports
+EAGER = SETUP + """
+import types
+package = types.ModuleType({package!r})
+package.__path__ = [{root!r}]
+sys.modules[{package!r}] = package
+try:
+    import wx
+    modules = ["kle_placer_action"]
+except ImportError:
+    modules = ["key_placer", "layout_cache", "validation", "placement", "profiling", "logs", "serial", "util"]
+for name in modules:
+    importlib.import_module({package!r} + "." + name)
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+def measure(script: str):
+    """Best import time in seconds over `REPEAT` fresh interpreters, and the number of modules loaded."""
+    code = script.format(benchmarks=BENCHMARKS, package=PACKAGE, root=ROOT, init=os.path.join(ROOT, "__init__.py"))
+    best, modules = float("inf"), 0
+    for _ in range(REPEAT):
+        seconds, modules = subprocess.check_output([sys.executable, "-c", code], text=True).split()
+        best = min(best, float(seconds))
+    return best, int(modules)
+
+def main():
+    print("{:<32} {:>10} {:>10}".format("", "time (ms)", "modules"))
+    register, register_modules = measure(REGISTER)
+    eager, eager_modules = measure(EAGER)
+    print("{:<32} {:>10.2f} {:>10}".format("register (lazy)", register * 1000, register_modules))
+    print("{:<32} {:>10.2f} {:>10}".format("dialog, parser and placer", eager * 1000, eager_modules))
+    print("Registering no longer imports the dialog, parser and placer, saving about {:.1f} ms of editor startup".format((eager - register) * 1000))
+
+if __name__ == "__main__":
+    main()
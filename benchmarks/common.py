@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+import types
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "kle_placer"
+
+def import_module(name: str):
+    """Imports a module of the plugin (e.g. `serial`) without running its `__init__.py`,
+    which registers the action plugin and needs KiCad.
+    """
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module("{}.{}".format(PACKAGE, name))
+
+def use_fake_pcbnew():
+    """Makes `import pcbnew` import the in-process stand-in from `fake_pcbnew`, so modules that need KiCad
+    (e.g. `key_placer`) can be imported and measured anywhere. Must be called before importing them.
+    """
+    import fake_pcbnew
+    sys.modules["pcbnew"] = fake_pcbnew
+    return fake_pcbnew
+
+def best_of(func, repeat: int = 5, setup=None) -> float:
+    """Best wall-clock time in seconds of `repeat` calls to `func`.
+    If given, `setup` is called (untimed) before every call and its result is passed to `func`.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,162 @@
+"""In-process stand-in for the parts of the `pcbnew` API the placer uses (`BOARD`, `FOOTPRINT`, `PAD` nets, points, angles and unit conversion),
+so placement can be benchmarked without KiCad. Geometry follows KiCad: positions are integer nanometres, orientations
+are normalized to (-180, 180] degrees and `Rotate` turns counterclockwise (on screen) for positive angles.
+
+Every setter and lookup is counted in `CALLS`, to compare how much work different implementations ask of KiCad.
+"""
+import math
+
+IU_PER_MM = 1000000
+DEGREES_T = 1
+
+CALLS = {}
+
+def count_call(name: str):
+    CALLS[name] = CALLS.get(name, 0) + 1
+
+def FromMM(mm) -> int:
+    return int(float(mm) * IU_PER_MM)
+
+def ToMM(iu) -> float:
+    return float(iu) / IU_PER_MM
+
+def KiROUND(value) -> int:
+    return int(math.floor(value + 0.5)) if value >= 0 else -int(math.floor(-value + 0.5))
+
+def normalize_degrees(angle: float) -> float:
+    while angle <= -180:
+        angle += 360
+    while angle > 180:
+        angle -= 360
+    return angle
+
+class VECTOR2I():
+    def __init__(self, x=0, y=0):
+        self.x = int(x)
+        self.y = int(y)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y)
+
+    def __eq__(self, other):
+        return (self.x, self.y) == (other.x, other.y)
+
+    def __repr__(self):
+        return "{}({}, {})".format(type(self).__name__, self.x, self.y)
+
+class wxPoint(VECTOR2I):
+    pass
+
+class EDA_ANGLE():
+    def __init__(self, value, unit=DEGREES_T):
+        self.value = float(value)
+
+    def AsDegrees(self) -> float:
+        return self.value
+
+def rotate_point(x: int, y: int, angle: float):
+    """Same as KiCad's RotatePoint: exact for multiples of 90 degrees, rounded to the nearest nanometre otherwise."""
+    angle = angle % 360
+    if angle == 0:
+        return x, y
+    if angle == 90:
+        return y, -x
+    if angle == 180:
+        return -x, -y
+    if angle == 270:
+        return -y, x
+    sin, cos = math.sin(math.radians(angle)), math.cos(math.radians(angle))
+    return KiROUND(y * sin + x * cos), KiROUND(y * cos - x * sin)
+
+class PAD():
+    def __init__(self, net_code: int = 0):
+        self.net_code = net_code
+
+    def GetNetCode(self) -> int:
+        return self.net_code
+
+class FOOTPRINT():
+    def __init__(self, reference: str, x: int = 0, y: int = 0, orientation: float = 0, nets=()):
+        self.reference = reference
+        self.position = VECTOR2I(x, y)
+        self.orientation = normalize_degrees(orientation)
+        self.flipped = False
+        self.pads = [PAD(net) for net in nets]
+
+    def Pads(self) -> list:
+        return list(self.pads)
+
+    def GetReference(self) -> str:
+        count_call("GetReference")
+        return self.reference
+
+    def GetPosition(self) -> VECTOR2I:
+        return VECTOR2I(self.position.x, self.position.y)
+
+    def SetPosition(self, position):
+        count_call("SetPosition")
+        self.position = VECTOR2I(position.x, position.y)
+
+    def GetOrientationDegrees(self) -> float:
+        return self.orientation
+
+    def SetOrientationDegrees(self, degrees: float):
+        count_call("SetOrientation")
+        self.orientation = normalize_degrees(degrees)
+
+    def GetOrientation(self) -> EDA_ANGLE:
+        return EDA_ANGLE(self.orientation)
+
+    def SetOrientation(self, angle: EDA_ANGLE):
+        count_call("SetOrientation")
+        self.orientation = normalize_degrees(angle.value)
+
+    def Rotate(self, centre, angle: EDA_ANGLE):
+        count_call("Rotate")
+        x, y = rotate_point(self.position.x - centre.x, self.position.y - centre.y, angle.value)
+        self.position = VECTOR2I(x + centre.x, y + centre.y)
+        self.orientation = normalize_degrees(self.orientation + angle.value)
+
+    def IsFlipped(self) -> bool:
+        return self.flipped
+
+    def Flip(self, centre, flip_left_right: bool):
+        # Mirrors top to bottom (or left to right) around `centre` onto the other side of the board
+        count_call("Flip")
+        if flip_left_right:
+            self.position = VECTOR2I(2 * centre.x - self.position.x, self.position.y)
+            self.orientation = normalize_degrees(-self.orientation)
+        else:
+            self.position = VECTOR2I(self.position.x, 2 * centre.y - self.position.y)
+            self.orientation = normalize_degrees(180 - self.orientation)
+        self.flipped = not self.flipped
+
+class BOARD():
+    def __init__(self, footprints=(), file_name: str = "benchmark.kicad_pcb"):
+        self.footprints = list(footprints)
+        self.file_name = file_name
+
+    def GetFootprints(self) -> list:
+        count_call("GetFootprints")
+        return list(self.footprints)
+
+    def FindFootprintByReference(self, reference: str) -> FOOTPRINT:
+        count_call("FindFootprintByReference")
+        for footprint in self.footprints:
+            if footprint.reference == reference:
+                return footprint
+        return None
+
+    def GetFileName(self) -> str:
+        return self.file_name
+
+class ActionPlugin():
+    def defaults(self):
+        pass
+
+    def register(self):
+        count_call("register")
+        self.defaults()
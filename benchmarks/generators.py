@@ -0,0 +1,117 @@
+import random
+import json
+
+def generate_rows(keys: int, columns: int = 20, seed: int = 0) -> list:
+    """Generates the rows of a KLE json with `keys` keys, `columns` keys per row,
+    with a mix of key sizes, legends, colours and font sizes.
+    """
+    rng = random.Random(seed)
+    rows = [{"name": "synthetic {}".format(keys), "author": "benchmarks"}]
+    placed = 0
+    while placed < keys:
+        row = []
+        for column in range(min(columns, keys - placed)):
+            props = {}
+            if rng.random() < 0.2:
+                props["w"] = rng.choice([1.25, 1.5, 1.75, 2, 2.25, 2.75, 6.25])
+            if rng.random() < 0.1:
+                props["c"] = rng.choice(["#cccccc", "#aaaaaa", "#e5a03b"])
+            if rng.random() < 0.05:
+                props["f"] = rng.choice([3, 4, 5])
+            if rng.random() < 0.05:
+                props["x"] = 0.25
+            if props:
+                row.append(props)
+            row.append("{}\n\n\n\n{}".format(chr(ord("A") + column % 26), placed + 1))
+            placed += 1
+        rows.append(row)
+    return rows
+
+def generate_layout(keys: int, columns: int = 20, rotated_clusters: bool = True, multilayouts: bool = True, seed: int = 0) -> list:
+    """Generates the rows of a KLE json for Specific Reference Mode that places `keys` switches, referenced 1 to `keys` (label 4).
+
+    With `rotated_clusters`, every 50 keys include a cluster of 6 keys rotated around its own origin (like a thumb cluster)
+    to the right of the main grid. With `multilayouts`, every 25th key of the grid is the default option of a multilayout
+    group, with an alternative option of the same size below the grid, which is squished onto it.
+    """
+    from common import import_module
+    serial = import_module("serial")
+
+    rng = random.Random(seed)
+    cluster_size = 6
+    clusters = keys // 50 if rotated_clusters else 0
+    grid_keys = keys - clusters * cluster_size
+    rows = (grid_keys + columns - 1) // columns
+
+    def make_key(reference, x, y, width=1.0, **kwargs):
+        labels = [""] * 12
+        labels[0] = chr(ord("A") + reference % 26)
+        labels[4] = str(reference)
+        return serial.Key(labels=labels, x=x, y=y, width=width, **kwargs)
+
+    layout = []
+    reference = 0
+    for ndx in range(grid_keys):
+        reference += 1
+        row, column = divmod(ndx, columns)
+        key = make_key(reference, float(column), float(row))
+        layout.append(key)
+
+        if multilayouts and ndx % 25 == 24:
+            group = str(ndx // 25)
+            key.labels[3], key.labels[5] = group, "0"
+            alternative = make_key(reference, float(column), float(rows + 1 + ndx // 25))
+            alternative.labels[3], alternative.labels[5] = group, "1"
+            layout.append(alternative)
+
+    for cluster in range(clusters):
+        rotation_x, rotation_y = float(columns + 1), float(cluster * 4)
+        angle = rng.choice([15.0, -15.0, 30.0, -30.0])
+        for ndx in range(cluster_size):
+            reference += 1
+            layout.append(make_key(reference, rotation_x + ndx % 3, rotation_y + ndx // 3,
+                                   rotation_x=rotation_x, rotation_y=rotation_y, rotation_angle=angle))
+
+    kbd = serial.Keyboard(meta=serial.KeyboardMetadata(name="synthetic {}".format(keys), author="benchmarks"), keys=layout)
+    return serial.serialize(kbd)
+
+def generate_board(keys: int, stabilizer_every: int = 10, seed: int = 0, companions=()):
+    """Generates a `fake_pcbnew.BOARD` with switches SW1 to SW`keys`, their diodes and a stabilizer for every `stabilizer_every`th switch,
+    all scattered randomly except for the first switch and diode, which set the origin and diode offset for the placer.
+    Every key also gets a footprint for each of the `companions` reference formats (e.g. `LED{}`), the first one next to SW1.
+    """
+    import fake_pcbnew
+
+    rng = random.Random(seed)
+    def scattered(reference):
+        return fake_pcbnew.FOOTPRINT(reference, rng.randrange(0, 500000000), rng.randrange(0, 500000000), rng.choice([0, 90, 180, -90]))
+
+    footprints = [fake_pcbnew.FOOTPRINT("SW1", 25000000, 25000000), fake_pcbnew.FOOTPRINT("D1", 25000000, 33000000, 90)]
+    for reference in range(2, keys + 1):
+        footprints.append(scattered("SW{}".format(reference)))
+        footprints.append(scattered("D{}".format(reference)))
+    for reference in range(stabilizer_every, keys + 1, stabilizer_every):
+        footprints.append(scattered("S{}".format(reference)))
+    for ndx, companion_format in enumerate(companions):
+        footprints.append(fake_pcbnew.FOOTPRINT(companion_format.format(1), 25000000 - 4000000 * (ndx + 1), 30000000, 180))
+        footprints.extend(scattered(companion_format.format(reference)) for reference in range(2, keys + 1))
+
+    rng.shuffle(footprints)
+    return fake_pcbnew.BOARD(footprints)
+
+def jitter_points(points: list, amount: float = 0.3, seed: int = 0) -> list:
+    """Moves every point by up to `amount` on each axis, like switches roughly placed by hand where the keys will go."""
+    rng = random.Random(seed)
+    return [(x + rng.uniform(-amount, amount), y + rng.uniform(-amount, amount)) for x, y in points]
+
+def raw_data(rows: list) -> str:
+    """Writes rows the way the KLE editor's "Raw data" tab shows them: one row per line, without an outer array
+    and with unquoted object keys, e.g. `[{w:1.5},"Tab","Q"]`.
+    """
+    def value(item):
+        if isinstance(item, dict):
+            return "{" + ",".join("{}:{}".format(key, value(item[key])) for key in item) + "}"
+        if isinstance(item, list):
+            return "[" + ",".join(value(element) for element in item) + "]"
+        return json.dumps(item)
+    return ",\n".join(value(row) for row in rows)
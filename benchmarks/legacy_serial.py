@@ -0,0 +1,166 @@
+"""The deepcopy based `serial.deserialize` (and the `set_ndx` it used), kept unchanged to benchmark and check the current one against."""
+from copy import deepcopy
+
+from common import import_module
+
+serial = import_module("serial")
+Key = serial.Key
+KeyboardMetadata = serial.KeyboardMetadata
+Keyboard = serial.Keyboard
+LABEL_MAP = serial.LABEL_MAP
+deserialize_error = serial.deserialize_error
+
+def get_ndx(lst: list, ndx: int):
+    try:
+        return lst[ndx]
+    except IndexError:
+        return None
+
+def set_ndx(lst: list, ndx: int, obj: object, filler=None) -> list: 
+    """Sets the index `ndx` in a list to any object `obj`,
+    filling the empty spaces with `filler` (`None` by default) if the length of 
+    the list is smaller than `ndx`. Used to replicate JavaScript behaviour.
+    """
+    try:
+        lst[ndx] = obj
+        return lst
+    except IndexError:
+        dct = {}
+        dct[ndx] = obj
+        for i in range(0, max(ndx+1, len(lst))):
+            if i == ndx:
+                continue
+            try:
+                dct[i] = lst[i]
+            except IndexError:
+                dct[i] = filler
+        while len(lst) < len(dct.keys()):
+            lst.append(filler)
+        for i, key in enumerate(dct.keys()):
+            lst[i] = (dct[i])
+
+def reorder_labels_in(labels, align, filler=None, skipdefault=False):
+    if filler is not None:
+        ret = [filler, ] * 12 # Mainly for key labels
+    else:
+        ret = []
+    for i in range(1, len(labels)) if skipdefault else range(len(labels)):
+        lm = LABEL_MAP[align][i]
+        if lm == -1:
+            continue
+        lbl = labels[i]
+        set_ndx(ret, lm, lbl)
+    return ret
+
+def deserialize(rows):
+    # Initialize with defaults
+    current = deepcopy(Key())
+    meta = deepcopy(KeyboardMetadata())
+    keys = []
+    cluster = { "x": 0, "y": 0 }
+    align = 4
+    for r, rows_r in enumerate(rows):
+        if isinstance(rows_r, list):
+            for k, item in enumerate(rows_r):
+                key = item
+                if isinstance(key, str):
+                    new_key = deepcopy(current)
+                    new_key.width2 = new_key.width2 if new_key.width2 != 0 else current.width
+                    new_key.height2 = new_key.height2 if new_key.height2 != 0 else current.height
+                    new_key.labels = reorder_labels_in(key.split("\n"), align, "")
+                    new_key.text_size = reorder_labels_in(new_key.text_size, align)
+
+                    for i in range(12):
+                        if not get_ndx(new_key.labels, i):
+                            set_ndx(new_key.text_size, i, None)
+                            set_ndx(new_key.text_color, i, None)
+                        if get_ndx(new_key.text_size, i) == new_key.default.text_size:
+                            set_ndx(new_key.text_size, i, None)
+                        if get_ndx(new_key.text_color, i) == new_key.default.text_color:
+                            set_ndx(new_key.text_color, i, None)
+
+                    keys.append(new_key)
+
+                    current.x += current.width
+                    current.width = current.height = 1
+                    current.x2 = current.y2 = current.width2 = current.height2 = 0
+                    current.nub = current.stepped = current.decal = False
+
+                else:
+                    if item.get('r') != None:
+                        if k != 0:
+                            deserialize_error("'r' can only be used on the first key in a row", item)
+                        current.rotation_angle = item.get('r')
+                    if item.get('rx') != None:
+                        if k != 0:
+                            deserialize_error("'rx' can only be used on the first key in a row", item)
+                        cluster["x"] = float(item['rx'])
+                        current.rotation_x = cluster["x"]
+                        current.x = cluster["x"]
+                        current.y = cluster["y"]
+                    if item.get('ry') != None:
+                        if k != 0:
+                            deserialize_error("'ry' can only be used on the first key in a row", item)
+                        cluster["y"] = float(item['ry'])
+                        current.rotation_y = cluster["y"]
+                        current.x = cluster["x"]
+                        current.y = cluster["y"]
+                    if item.get('a') != None:
+                        align = item.get('a')
+                    if item.get('f'):
+                        current.default.text_size = item.get('f')
+                        current.text_size = []
+                    if item.get('f2'):
+                        for i in range(1, 12):
+                            set_ndx(current.text_size, i, item.get('f2'))
+                    if item.get('fa'):
+                        current.text_size = item.get('fa')
+                    if item.get('p'):
+                        current.profile = item.get('p')
+                    if item.get('c'):
+                        current.color = item.get('c')
+                    if item.get('t'):
+                        split = item.get('t').split('\n')
+                        current.default.text_color = split[0]
+                        current.text_color = reorder_labels_in(split, align)
+                    if item.get('x'):
+                        current.x += item.get('x')
+                    if item.get('y'):
+                        current.y += item.get('y')
+                    if item.get('w'):
+                        current.width = current.width2 = item.get('w')
+                    if item.get('h'):
+                        current.height = current.height2 = item.get('h')
+                    if item.get('x2'):
+                        current.x2 = item.get('x2')
+                    if item.get('y2'):
+                        current.y2 = item.get('y2')
+                    if item.get('w2'):
+                        current.width2 = item.get('w2')
+                    if item.get('h2'):
+                        current.height2 = item.get('h2')
+                    if item.get('n'):
+                        current.nub = item.get('n')
+                    if item.get('l'):
+                        current.stepped = item.get('l')
+                    if item.get('d'):
+                        current.decal = item.get('d')
+                    if item.get('g') != None:
+                        current.ghost = item.get('g')
+                    if item.get('sm'):
+                        current.sm = item.get('sm')
+                    if item.get('sb'):
+                        current.sb = item.get('sb')
+                    if item.get('st'):
+                        current.st = item.get('st')
+            # End of the row
+            current.y += 1
+        elif isinstance(rows_r, dict):
+            if r != 0:
+                deserialize_error("keyboard metadata must the be first element", rows_r)
+            for prop in vars(KeyboardMetadata).keys():
+                if prop in rows_r:
+                    setattr(meta, prop, rows_r[prop])
+        current.x = current.rotation_x
+
+    return Keyboard(meta, keys)
@@ -0,0 +1,154 @@
+"""Benchmark suite for parsing (also KLE raw data), serializing, squishing multilayouts, planning poses, full placement runs (also with companion footprints), applying saved plans, matching keys to switches (also with a switch parked off the board) and pairing diodes and stabilizers with switches by position, on synthetic layouts
+from 60 to 10,000 keys (with rotated clusters and multilayouts), placed onto the in-process `fake_pcbnew` board.
+
+Timings are compared against the baselines stored in `baselines.json`. A benchmark regresses if it is more than
+`threshold` times slower than its baseline and also more than `noise_floor` milliseconds slower, in which case the suite
+exits with 1: benchmarks that take well under a millisecond vary by more than the threshold from run to run. A benchmark
+that looks slower is timed again before it counts as a regression. Baselines depend on the machine, record them with
+`--update` before comparing changes.
+
+Run with `python benchmarks/suite.py [--update] [--threshold 1.5] [--noise-floor 2] [--filter run]`.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+
+from common import import_module, use_fake_pcbnew, best_of
+from generators import generate_layout, generate_board, jitter_points, raw_data
+
+use_fake_pcbnew()
+serial = import_module("serial")
+key_placer = import_module("key_placer")
+layout = import_module("layout")
+matching = import_module("matching")
+placement = import_module("placement")
+raw_data_module = import_module("raw_data")
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = 1.5
+DEFAULT_NOISE_FLOOR = 2.0 # ms
+SIZES = (60, 1000, 10000)
+# Calls timed (the best one counts) per layout size, small layouts are timed more often since they're quick and noisy
+REPEATS = {60: 25, 1000: 5, 10000: 3}
+
+logger = logging.getLogger("benchmarks")
+
+COMPANIONS = ("LED{}", "C{}")
+
+def place(kbd, board, companion_formats=()):
+    placer = key_placer.KeyPlacer(logger, board, kbd)
+    return placer.Run("SW{}", "S{}", "D{}", True, True, True, companion_formats=companion_formats)
+
+def save_plan(kbd, keys: int, directory: str) -> str:
+    board = generate_board(keys)
+    path = os.path.join(directory, "{}{}".format(keys, placement.PLAN_FILE_EXTENSION))
+    key_placer.KeyPlacer(logger, board, None).save_plan_file(place(kbd, board), path)
+    return path
+
+def placed_board(kbd, keys: int):
+    board = generate_board(keys)
+    place(kbd, board)
+    return board
+
+def pair(board, keys: int):
+    placer = key_placer.KeyPlacer(logger, board, None)
+    return placer.pair_footprints("SW{}", "S{}", "D{}", range(1, keys + 1))
+
+def benchmarks(directory: str):
+    """Yields `(name, func, setup)` for every benchmark, see `best_of`. Saved plans are written to `directory`."""
+    for keys in SIZES:
+        rows = generate_layout(keys)
+        kbd = serial.deserialize(rows)
+        yield "deserialize/{}".format(keys), lambda rows=rows: serial.deserialize(rows), None
+        text = raw_data(rows)
+        yield "parse_raw_data/{}".format(keys), lambda text=text: raw_data_module.parse_raw_data(text), None
+        yield "serialize/{}".format(keys), lambda kbd=kbd: serial.serialize(kbd), None
+        yield "squish/{}".format(keys), lambda kbd=kbd: layout.prepare_keys(kbd, False, logger), None
+        prepared = layout.prepare_keys(kbd, True, logger)
+        yield ("plan/{}".format(keys), lambda prepared=prepared: placement.plan_key_poses(prepared, (0, 0), 19050000, 0, 90, (0, 5000000)), None)
+        yield "run/{}".format(keys), lambda board, kbd=kbd: place(kbd, board), lambda keys=keys: generate_board(keys)
+        yield ("run_companions/{}".format(keys), lambda board, kbd=kbd: place(kbd, board, COMPANIONS),
+               lambda keys=keys: generate_board(keys, companions=COMPANIONS))
+
+        plan = save_plan(kbd, keys, directory)
+        yield ("apply_plan/{}".format(keys), lambda board, plan=plan: key_placer.KeyPlacer(logger, board, None).apply_plan_file(plan),
+               lambda keys=keys: generate_board(keys))
+
+        centres = [matching.key_centre(key) for key in prepared]
+        sources, targets = matching.normalize_points(centres), matching.normalize_points(jitter_points(centres))
+        yield "match/{}".format(keys), lambda sources=sources, targets=targets: matching.match_points(sources, targets), None
+        parked = jitter_points(centres)
+        parked[len(parked) // 2] = (10000, 10000) # One switch parked far off the board
+        parked = matching.normalize_points(parked)
+        yield "match_outlier/{}".format(keys), lambda sources=sources, parked=parked: matching.match_points(sources, parked), None
+        yield "pair/{}".format(keys), lambda board, keys=keys: pair(board, keys), lambda kbd=kbd, keys=keys: placed_board(kbd, keys)
+
+def load_baselines() -> dict:
+    try:
+        with open(BASELINES, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except OSError:
+        return {"threshold": DEFAULT_THRESHOLD, "noise_floor": DEFAULT_NOISE_FLOOR, "seconds": {}}
+
+def regressed(seconds: float, baseline: float, threshold: float, noise_floor: float) -> bool:
+    return seconds > baseline * threshold and (seconds - baseline) * 1000 > noise_floor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="store the timings of this run as the new baselines")
+    parser.add_argument("--threshold", type=float, help="slowdown factor (against the baseline) that counts as a regression, "
+                                                        "defaults to the one stored with the baselines")
+    parser.add_argument("--noise-floor", type=float, help="slowdowns of less than this many milliseconds are never regressions, "
+                                                          "defaults to the one stored with the baselines")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines()
+    threshold = args.threshold or baselines.get("threshold", DEFAULT_THRESHOLD)
+    noise_floor = args.noise_floor if args.noise_floor is not None else baselines.get("noise_floor", DEFAULT_NOISE_FLOOR)
+    results = {}
+    regressions = []
+
+    print("{:<22} {:>12} {:>12} {:>8}".format("benchmark", "time (ms)", "base (ms)", "ratio"))
+    directory = tempfile.mkdtemp(prefix="kle_placer_benchmarks")
+    for name, func, setup in benchmarks(directory):
+        if args.filter not in name:
+            continue
+        repeat = REPEATS[int(name.rpartition("/")[2])]
+        seconds = best_of(func, repeat, setup)
+        baseline = baselines["seconds"].get(name)
+        if baseline is None:
+            results[name] = seconds
+            print("{:<22} {:>12.2f} {:>12} {:>8}".format(name, seconds * 1000, "-", "-"))
+            continue
+        if regressed(seconds, baseline, threshold, noise_floor):
+            # Rule out the machine being busy for a moment
+            seconds = min(seconds, best_of(func, 2 * repeat, setup))
+        results[name] = seconds
+
+        ratio = seconds / baseline
+        flag = " REGRESSION" if regressed(seconds, baseline, threshold, noise_floor) else ""
+        print("{:<22} {:>12.2f} {:>12.2f} {:>7.2f}x{}".format(name, seconds * 1000, baseline * 1000, ratio, flag))
+        if flag:
+            regressions.append(name)
+
+    if args.update:
+        baselines["threshold"] = threshold
+        baselines["noise_floor"] = noise_floor
+        baselines["seconds"].update({name: round(seconds, 6) for name, seconds in results.items()})
+        with open(BASELINES, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print("Updated {} baselines in {}".format(len(results), BASELINES))
+        return 0
+
+    if regressions:
+        print("{} benchmarks regressed more than {}x (and {} ms): {}".format(len(regressions), threshold, noise_floor, ", ".join(regressions)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
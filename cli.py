@@ -0,0 +1,196 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pcbnew
+
+from .key_placer import KeyPlacer
+from .layout_cache import LAYOUT_CACHE
+from .profiling import RunStats, profile_call
+from .placement import PLAN_FORMATS, PLAN_FILE_EXTENSION
+
+def placer_arguments(args) -> dict:
+    """Keyword arguments for `KeyPlacer.Run`, with the same options as the plugin dialog."""
+    return {
+        "key_format": args.key_format,
+        "stabilizer_format": args.stabilizer_format,
+        "diode_format": args.diode_format,
+        "move_diodes": not args.no_move_diodes,
+        "relative_diode_mode": not args.no_relative_diodes,
+        "rotation_mode": args.specific_ref_mode,
+        "dry_run": args.dry_run,
+        "auto_match": args.auto_match,
+        "pair_footprints": args.pair_footprints,
+        "companion_formats": tuple(args.companion_format),
+    }
+
+def output_path(board_path: str, output_dir: str, plan_format: str = None) -> str:
+    """Where to save a placed board, or its plan (e.g. `board.plan.json`) for a dry run with `plan_format`."""
+    path = os.path.join(output_dir, os.path.basename(board_path)) if output_dir else board_path
+    if plan_format:
+        path = "{}.plan.{}".format(os.path.splitext(path)[0], plan_format)
+    return path
+
+# Options of a batch that are the same for every job (see `get_parser` for what they do)
+JobOptions = namedtuple("JobOptions", ["cache_dir", "report_dir", "profile", "save_plan", "apply_plan"], defaults=(None, None, False, False, False))
+
+def plan_file_path(output: str) -> str:
+    """Where to save the plan of a board with `--save-plan`, e.g. `board.plan.json` (also for the `board.plan.csv` of a dry run)."""
+    path = os.path.splitext(output)[0]
+    if path.endswith(".plan"):
+        path = path[:-len(".plan")]
+    return path + PLAN_FILE_EXTENSION
+
+def place_board(logger, board_path: str, layout_path: str, output: str, placer_kwargs: dict, options: JobOptions = JobOptions(), stats: RunStats = None):
+    """Loads a board, places the keys of a KLE json onto it and saves it to `output`.
+    For a dry run, the plan is saved to `output` instead (json or csv by its extension) and the board is left as it is.
+    With `options.apply_plan`, `layout_path` is a json plan saved by an earlier run (or dry run) that is applied as is, without the KLE.
+    Layouts are cached, so placing the same KLE onto several boards only parses it once per process.
+    """
+    logger.debug("Placing %s onto %s", layout_path, board_path)
+    stats = stats if stats is not None else RunStats()
+    with stats.phase("load_board"):
+        board = pcbnew.LoadBoard(board_path)
+
+    if options.apply_plan:
+        placer = KeyPlacer(logger, board, None, stats=stats)
+        plan = placer.apply_plan_file(layout_path, placer_kwargs.get("incremental", False))
+    else:
+        keys = LAYOUT_CACHE.load(layout_path, placer_kwargs["rotation_mode"], logger, options.cache_dir, stats)
+        placer = KeyPlacer(logger, board, None, keys, stats=stats)
+        plan = placer.Run(**placer_kwargs)
+
+    dry_run = placer_kwargs.get("dry_run")
+    # The json plan of a dry run already is the plan file
+    if options.save_plan and not (dry_run and plan_file_path(output) == output):
+        placer.save_plan_file(plan, plan_file_path(output))
+
+    if dry_run:
+        placer.save_plan_file(plan, output)
+    else:
+        with stats.phase("save_board"):
+            pcbnew.SaveBoard(output, board)
+    logger.debug("Saved %s", output)
+
+# Outcome of placing one layout onto one board, `error` is None if it succeeded
+JobResult = namedtuple("JobResult", ["board", "layout", "output", "seconds", "error"])
+
+def log_level(verbosity: int) -> int:
+    # -v logs a summary of every run, -vv every placement step
+    return [logging.WARNING, logging.INFO, logging.DEBUG][min(verbosity, 2)]
+
+def configure_logging(verbosity: int):
+    logging.basicConfig(level=log_level(verbosity),
+                        format='%(asctime)s %(process)d %(name)s %(lineno)d: %(message)s',
+                        datefmt='%H:%M:%S')
+
+def report_path(report_dir: str, output: str, extension: str) -> str:
+    return os.path.join(report_dir, os.path.splitext(os.path.basename(output))[0] + extension)
+
+def run_job(board_path: str, layout_path: str, output: str, placer_kwargs: dict, options: JobOptions = JobOptions()) -> JobResult:
+    """Places a single board, catching any error so one bad variant doesn't stop the rest of the batch.
+    With a `report_dir`, the run's phase timings and counters (and its cProfile profile if `profile`) are saved there.
+    """
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    stats = RunStats()
+    error = None
+    try:
+        if options.profile:
+            profile_call(report_path(options.report_dir, output, ".prof"), place_board, logger, board_path, layout_path, output, placer_kwargs, options, stats)
+        else:
+            place_board(logger, board_path, layout_path, output, placer_kwargs, options, stats)
+    except Exception as e:
+        error = str(e) or repr(e)
+        logger.error("Failed to place %s onto %s: %s", layout_path, board_path, error)
+    if options.report_dir:
+        stats.finish()
+        stats.write(report_path(options.report_dir, output, ".report.json"), board=board_path, layout=layout_path, output=output, error=error)
+    return JobResult(board_path, layout_path, output, time.perf_counter() - start, error)
+
+def run_batch(jobs, placer_kwargs: dict, processes: int = 1, verbosity: int = 0, options: JobOptions = JobOptions()) -> list:
+    """Runs `(board, layout, output)` jobs, in a pool of `processes` worker processes if there is more than one.
+    Every worker loads, places and saves its own boards. Results are returned in the same order as `jobs`.
+    """
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        return [run_job(board, layout, output, placer_kwargs, options) for board, layout, output in jobs]
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=configure_logging, initargs=(verbosity,)) as executor:
+        futures = [executor.submit(run_job, board, layout, output, placer_kwargs, options) for board, layout, output in jobs]
+        return [future.result() for future in futures]
+
+def print_summary(results: list, wall_time: float, file=sys.stdout):
+    for result in results:
+        status = "FAILED" if result.error else "placed"
+        line = "{} {:8.2f}s  {} -> {}".format(status, result.seconds, result.layout, result.output)
+        if result.error:
+            line += ": {}".format(result.error)
+        print(line, file=file)
+
+    failed = sum(1 for result in results if result.error)
+    print("{} boards, {} failed, {:.2f}s total job time, {:.2f}s wall time".format(
+        len(results), failed, sum(result.seconds for result in results), wall_time), file=file)
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Place switches, stabilizers and diodes on KiCad boards based on a KLE, without opening the PCB editor.")
+    parser.add_argument("files", nargs="+", metavar="BOARD LAYOUT",
+                        help="pairs of .kicad_pcb board and KLE layout (json download or raw data) paths, e.g. ansi.kicad_pcb ansi.json iso.kicad_pcb iso.json")
+    parser.add_argument("-o", "--output-dir", help="directory to save the placed boards to (default: overwrite the input boards)")
+    parser.add_argument("--key-format", default="SW{}", help="key annotation format string (default: %(default)s)")
+    parser.add_argument("--stabilizer-format", default="S{}", help="stabilizer annotation format string (default: %(default)s)")
+    parser.add_argument("--diode-format", default="D{}", help="diode annotation format string (default: %(default)s)")
+    parser.add_argument("--companion-format", action="append", default=[], metavar="FORMAT",
+                        help="annotation format string of other footprints every key has (e.g. LED{}), placed relative to the first key's like diodes, "
+                             "can be repeated")
+    parser.add_argument("--no-move-diodes", action="store_true", help="don't move diodes")
+    parser.add_argument("--no-relative-diodes", action="store_true", help="don't move diodes based on the first switch and diode")
+    parser.add_argument("--specific-ref-mode", action="store_true", help="Specific Reference Mode, required for rotated keys")
+    parser.add_argument("--auto-match", action="store_true",
+                        help="match every key to the switch footprint nearest to it (by where the switches are on the board now) instead of by reference")
+    parser.add_argument("--pair-footprints", action="store_true",
+                        help="move the diode and stabilizer that share a net with (or else are nearest to) every switch, instead of the ones with the same number")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="don't change the boards, only save the plan (the target position and orientation of every footprint) next to them")
+    parser.add_argument("--plan-format", choices=PLAN_FORMATS, default="json", help="file format of dry run plans, only json plans can be reapplied with --apply-plans (default: %(default)s)")
+    parser.add_argument("--save-plan", action="store_true",
+                        help="also save the plan of every board as a {} file next to it, to reapply it later with --apply-plans".format(PLAN_FILE_EXTENSION))
+    parser.add_argument("--apply-plans", action="store_true",
+                        help="the files are pairs of BOARD and {} plan saved with --save-plan or --dry-run, which are applied without a KLE".format(PLAN_FILE_EXTENSION))
+    parser.add_argument("--cache-dir", help="also cache parsed layouts as files in this directory, reused by later runs")
+    parser.add_argument("--report-dir", help="save a json report with the time taken by each phase and counters of every board to this directory")
+    parser.add_argument("--profile", action="store_true", help="also profile every board with cProfile, saving .prof files to --report-dir")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of boards to place in parallel worker processes, 0 to use every core (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log a summary of every board, repeat (-vv) to log every placement step")
+    return parser
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    if len(args.files) % 2:
+        parser.error("expected pairs of BOARD and LAYOUT paths")
+    if args.jobs < 0:
+        parser.error("--jobs can't be negative")
+    if args.profile and not args.report_dir:
+        parser.error("--profile requires --report-dir")
+
+    configure_logging(args.verbose)
+
+    for directory in (args.output_dir, args.report_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    jobs = [(board, layout, output_path(board, args.output_dir, args.plan_format if args.dry_run else None)) for board, layout in zip(args.files[::2], args.files[1::2])]
+
+    start = time.perf_counter()
+    options = JobOptions(args.cache_dir, args.report_dir, args.profile, args.save_plan, args.apply_plans)
+    results = run_batch(jobs, placer_arguments(args), args.jobs or os.cpu_count() or 1, args.verbose, options)
+    print_summary(results, time.perf_counter() - start)
+
+    return 1 if any(result.error for result in results) else 0
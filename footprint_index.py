@@ -0,0 +1,77 @@
+import re
+
+REFERENCE_PATTERN = re.compile(r"^(.*?)(\d+)$")
+
+def split_reference(reference: str):
+    """Splits a reference such as `SW12` into its prefix and number, e.g. `('SW', 12)`.
+    References without a trailing number are returned with a number of `None`.
+    """
+    match = REFERENCE_PATTERN.match(reference)
+    if match is None:
+        return reference, None
+    return match.group(1), int(match.group(2))
+
+class FootprintIndex():
+    """Reference lookup table for all footprints on a board, built with a single pass
+    over `board.GetFootprints()` instead of one `FindFootprintByReference` scan per lookup.
+    """
+    def __init__(self, board):
+        self.footprints = {} # reference -> footprint
+        self._prefixes = None # prefix (e.g. SW, S, D) -> list of references, built on first use (see `numbered`)
+        self.duplicates = [] # references that appear on more than one footprint
+        self.lookups = 0 # number of get/in lookups, for run reports
+
+        for footprint in board.GetFootprints():
+            reference = footprint.GetReference()
+
+            # Same as FindFootprintByReference, the first footprint with a reference wins
+            if reference in self.footprints:
+                self.duplicates.append(reference)
+                continue
+            self.footprints[reference] = footprint
+
+    @property
+    def prefixes(self) -> dict:
+        if self._prefixes is None:
+            self._prefixes = {}
+            for reference in self.footprints:
+                prefix, _ = split_reference(reference)
+                self._prefixes.setdefault(prefix, []).append(reference)
+        return self._prefixes
+
+    def __len__(self):
+        return len(self.footprints)
+
+    def __contains__(self, reference):
+        self.lookups += 1
+        return reference in self.footprints
+
+    def get(self, reference):
+        self.lookups += 1
+        return self.footprints.get(reference)
+
+    def numbered(self, reference_format: str) -> dict:
+        """Returns the references written with a format string such as `SW{}` (see the dialog's annotation formats),
+        by their number, e.g. `{1: 'SW1', 2: 'SW2'}`. Only references the format gives back for their number are included,
+        so zero-padded ones such as `SW012` are left out (`SW{}` of 12 is `SW12`).
+        """
+        prefix, _, suffix = reference_format.partition("{}")
+        if not suffix and not prefix[-1:].isdigit():
+            # A format that ends with the number (the usual `SW{}`) is looked up in the prefix table instead of matching every reference
+            references = {}
+            for reference in self.prefixes.get(prefix, ()):
+                number = split_reference(reference)[1]
+                if number is not None and reference_format.format(number) == reference:
+                    references.setdefault(number, reference)
+            return references
+
+        pattern = re.compile("^{}$".format(r"(\d+)".join(re.escape(part) for part in reference_format.split("{}"))))
+        references = {}
+        for reference in self.footprints:
+            match = pattern.match(reference)
+            if match is not None and len(set(match.groups())) == 1 and reference_format.format(int(match.group(1))) == reference:
+                references.setdefault(int(match.group(1)), reference)
+        return references
+
+    def missing(self, references) -> list:
+        return [reference for reference in references if reference not in self.footprints]
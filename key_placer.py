@@ -0,0 +1,345 @@
+import time
+import logging
+
+import pcbnew
+from pcbnew import BOARD, FOOTPRINT, VECTOR2I
+
+from .serial import Keyboard
+from .footprint_index import FootprintIndex
+from .layout import prepare_keys
+from .placement import Pose, PlacementPlan, plan_key_poses, build_plan, write_plan, load_plan, layout_origin, layout_offset
+from .profiling import RunStats
+from .validation import ValidationError, validate_placement, check_references, key_numbers
+from .matching import key_centre, normalize_points, match_points
+from .pairing import Pairing, pair_companions
+
+class BoardModifier():
+    def __init__(self, logger, board: BOARD):
+        self.logger = logger
+        self.board: BOARD = board
+        self.footprints: FootprintIndex = None
+
+    def index_footprints(self) -> FootprintIndex:
+        self.footprints = FootprintIndex(self.board)
+        self.logger.debug("Indexed %s footprints", len(self.footprints))
+        return self.footprints
+
+    def get_footprint(self, reference, required=True) -> FOOTPRINT:
+        self.logger.debug("Searching for %s footprint", reference)
+        if self.footprints is None:
+            self.index_footprints()
+        footprint = self.footprints.get(reference)
+        if footprint is None and required:
+            self.logger.error("Footprint not found")
+            raise Exception("Cannot find footprint {}".format(reference))
+        return footprint
+
+    def set_pose(self, footprint: FOOTPRINT, pose: Pose):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Setting %s footprint pose: %s", footprint.GetReference(), pose)
+        footprint.SetPosition(VECTOR2I(pose.x, pose.y))
+        footprint.SetOrientationDegrees(pose.orientation)
+
+    def apply_changes(self, changes: list):
+        """Applies `(footprint, pose, flip)` changes gathered over a whole run. When run as an action plugin, KiCad already
+        records everything the plugin changed as one undo entry and rebuilds/refreshes the board once afterwards.
+        """
+        for footprint, pose, flip in changes:
+            if flip:
+                self.flip(footprint)
+            self.set_pose(footprint, pose)
+
+    def has_pose(self, footprint: FOOTPRINT, pose: Pose) -> bool:
+        position = footprint.GetPosition()
+        return position.x == pose.x and position.y == pose.y and footprint.GetOrientationDegrees() == pose.orientation
+
+    def get_side(self, footprint: FOOTPRINT) -> str:
+        return "back" if footprint.IsFlipped() else "front"
+
+    def flip(self, footprint: FOOTPRINT):
+        # Moves the footprint to the other side of the board. Only used right before setting a pose, which overwrites
+        # the position and orientation the flip leaves it with (those depend on the flip direction, which differs between KiCad versions)
+        footprint.Flip(footprint.GetPosition(), False)
+
+
+
+# Last placement plan applied to each board (by file name) this session, for incremental placement.
+# Unsaved boards all have an empty file name, so they are never placed incrementally
+LAST_PLANS = {}
+
+class KeyPlacer(BoardModifier):
+    def __init__(self, logger, board: BOARD, layout, keys=None, stats: RunStats = None):
+        super().__init__(logger, board)
+        self.stats = stats if stats is not None else RunStats() # Phase timings and counters of the run, for run reports
+        self.layout: Keyboard = layout
+        self.prepared_keys = keys # Keys already prepared with layout.prepare_keys (e.g. from the layout cache), layout isn't needed then
+        self.keys: list = [] # Compact copies of the layout's keys that get placed, set by Run (see layout.prepare_keys)
+        self.matched_numbers: list = None # Switch number of every key when they are matched by position, see match_keys
+        self.pairing: Pairing = None # Diode and stabilizer of every switch when they are paired by net/position, see pair_footprints
+        self.key_distance = pcbnew.FromMM(19.05)
+        self.moved = 0
+        self.skipped = 0
+        self.reference_coordinate = pcbnew.wxPoint(pcbnew.FromMM(25), pcbnew.FromMM(25))
+
+    def match_keys(self, key_format):
+        """Gives every key the number of the switch footprint (`key_format`) nearest to it, comparing the layout with where
+        the switches are on the board now (roughly placed by hand, or as imported from the schematic). Both are scaled
+        to the same size first, so only their relative positions matter. The keys are then sorted by their switch number,
+        keys left without a switch (more keys than switches) go last with a number of None.
+        """
+        switches = self.footprints.numbered(key_format)
+        numbers = sorted(switches)
+        positions = [self.footprints.get(switches[number]).GetPosition() for number in numbers]
+
+        assignment = match_points(normalize_points([key_centre(key) for key in self.keys]),
+                                  normalize_points([(position.x, position.y) for position in positions]))
+        matched = [numbers[target] if target is not None else None for target in assignment]
+
+        order = sorted(range(len(self.keys)), key=lambda ndx: (matched[ndx] is None, matched[ndx] or 0))
+        self.keys = [self.keys[ndx] for ndx in order]
+        self.matched_numbers = [matched[ndx] for ndx in order]
+        self.stats.count("switches_matched", sum(1 for number in self.matched_numbers if number is not None))
+
+    def footprint_nets(self, footprint: FOOTPRINT) -> set:
+        # Net codes of all connected pads (0 is unconnected)
+        return {pad.GetNetCode() for pad in footprint.Pads() if pad.GetNetCode() > 0}
+
+    def describe_footprints(self, references) -> dict:
+        # Reference -> ((x, y), nets) of footprints, as pairing.pair_companions takes them
+        described = {}
+        for reference in references:
+            footprint = self.footprints.get(reference)
+            position = footprint.GetPosition()
+            described[reference] = ((position.x, position.y), self.footprint_nets(footprint))
+        return described
+
+    def pair_footprints(self, key_format, stabilizer_format, diode_format, numbers, companion_formats=()) -> Pairing:
+        """Pairs every diode (`diode_format`), stabilizer (`stabilizer_format`) and companion (`companion_formats`) on the board
+        with the switch it shares a net with, or else the nearest switch, where they are now. For boards whose references
+        don't line up, the pairing is used instead of giving switch `n` the diode and stabilizer numbered `n`.
+        """
+        if self.footprints is None:
+            self.index_footprints()
+        switches = self.describe_footprints(reference for reference in (key_format.format(number) for number in numbers) if reference in self.footprints.footprints)
+        diodes = self.describe_footprints(self.footprints.numbered(diode_format).values())
+        stabilizers = self.describe_footprints(self.footprints.numbered(stabilizer_format).values())
+
+        companions = {companion_format: pair_companions(switches, self.describe_footprints(self.footprints.numbered(companion_format).values()))
+                      for companion_format in companion_formats}
+
+        self.pairing = Pairing(pair_companions(switches, diodes), pair_companions(switches, stabilizers), companions)
+        self.stats.count("diodes_paired", len(self.pairing.diodes))
+        self.stats.count("stabilizers_paired", len(self.pairing.stabilizers))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for switch, diode, stabilizer in self.pairing.rows():
+                self.logger.debug("Paired %s with diode %s and stabilizer %s", switch, diode, stabilizer)
+
+        unpaired = len(diodes) - len(self.pairing.diodes)
+        if unpaired:
+            self.logger.warning("%s diodes weren't paired with a switch (there are fewer switches than diodes), they won't be moved", unpaired)
+        return self.pairing
+
+    def apply_plan(self, plan: PlacementPlan, incremental=False, sides: dict = None):
+        """Moves every footprint in the plan. In incremental mode, footprints whose target pose is the same as
+        in the last plan applied to this board (and that are still at that pose) are skipped.
+        Footprints that aren't on the side of the board given in `sides` (if any) are flipped.
+        """
+        board_name = self.board.GetFileName()
+        if incremental and not board_name:
+            self.logger.info("The board isn't saved yet, so every footprint is placed instead of only the changed ones")
+            incremental = False
+        changed = set(plan.changed(LAST_PLANS.get(board_name) if incremental else None))
+
+        changes = []
+        self.skipped = 0
+        rotations = 0
+        with self.stats.phase("compare"):
+            for reference, pose in plan.items():
+                footprint = self.footprints.get(reference)
+                flip = sides is not None and reference in sides and self.get_side(footprint) != sides[reference]
+                if not flip and reference not in changed and self.has_pose(footprint, pose):
+                    self.skipped += 1
+                    continue
+                if footprint.GetOrientationDegrees() != pose.orientation:
+                    rotations += 1
+                changes.append((footprint, pose, flip))
+
+        with self.stats.phase("apply"):
+            self.apply_changes(changes)
+        self.moved = len(changes)
+
+        self.stats.count("footprints_planned", len(plan))
+        self.stats.count("footprints_moved", self.moved)
+        self.stats.count("footprints_skipped", self.skipped)
+        self.stats.count("rotations", rotations)
+
+        if board_name:
+            LAST_PLANS[board_name] = plan
+        self.logger.debug("Moved %s footprints, skipped %s unchanged footprints", self.moved, self.skipped)
+
+    def save_plan_file(self, plan: PlacementPlan, path: str, format: str = None):
+        """Saves a plan, with the side of the board every footprint is on now, as json to reapply it later with `apply_plan_file`
+        (or exported as csv, see `placement.write_plan`).
+        """
+        if self.footprints is None:
+            self.index_footprints()
+        sides = {reference: self.get_side(self.footprints.get(reference)) for reference in plan.poses}
+        write_plan(plan, path, format, sides)
+        self.logger.debug("Saved plan of %s footprints to %s", len(plan), path)
+
+    def apply_plan_file(self, path: str, incremental=False) -> PlacementPlan:
+        """Moves footprints straight to the poses of a plan saved with `save_plan_file`, without parsing a KLE,
+        squishing multilayouts or working out the first key's rotation. Nothing is moved if any footprint is missing.
+        """
+        with self.stats.phase("load_plan"):
+            plan, sides = load_plan(path)
+
+        with self.stats.phase("index_footprints"):
+            self.index_footprints()
+        self.stats.count("footprints_on_board", len(self.footprints))
+
+        with self.stats.phase("validate"):
+            problems = check_references(self.footprints, list(plan.poses))
+        if problems:
+            for problem in problems:
+                self.logger.error(problem)
+            raise ValidationError(problems)
+
+        self.apply_plan(plan, incremental, sides)
+        self.stats.count("lookups", self.footprints.lookups)
+        self.stats.finish()
+
+        self.logger.info("Applied plan %s: moved %s footprints, skipped %s unchanged", path, self.moved, self.skipped)
+        return plan
+
+    def relative_offset(self, first_key: FOOTPRINT, footprint: FOOTPRINT, first_key_rotated: bool):
+        """Offset (x, y) in nm of a footprint from the first switch, which every key's diode or companion is placed at.
+        If the first key is already rotated, the offset is measured in the unrotated layout instead of on the board
+        (see `placement.layout_offset`), so `reference_coordinate` has to be set first.
+        """
+        position = footprint.GetPosition()
+        if first_key_rotated:
+            offset = layout_offset(self.keys[0], (position.x, position.y), (self.reference_coordinate.x, self.reference_coordinate.y), self.key_distance)
+            self.logger.debug("offset of %s in the unrotated layout %s", footprint.GetReference(), offset)
+            return offset
+        return position.x - first_key.GetPosition().x, position.y - first_key.GetPosition().y
+
+    def relative_rotation(self, footprint: FOOTPRINT, first_key_already_rotated: bool) -> float:
+        # Orientation every key's diode or companion gets, that of the first key's
+        rotation = footprint.GetOrientationDegrees()
+        if first_key_already_rotated:
+            rotation += self.keys[0].rotation_angle
+        return rotation
+
+    def Run(self, key_format, stabilizer_format, diode_format, move_diodes, relative_diode_mode, rotation_mode, incremental=False, dry_run=False,
+            auto_match=False, pair_footprints=False, companion_formats=()) -> PlacementPlan:
+        """Places every key's switch, stabilizer and diode, returning the plan that was applied.
+        With `dry_run` the plan is only computed, nothing on the board is changed.
+        With `auto_match` keys are matched to the switches nearest to them (see `match_keys`) instead of by reference.
+        With `pair_footprints` diodes and stabilizers are paired with switches by net and position (see `pair_footprints`) instead of by reference.
+        `companion_formats` are reference formats (e.g. `LED{}`) of other footprints every key has, which are placed like diodes
+        in the same pass, each relative to the first key's.
+        """
+
+        ### First, check all the multilayouts and squish all the same multilayouts into the same position on top of one another. ###
+
+        if self.prepared_keys is not None:
+            self.keys = list(self.prepared_keys)
+        else:
+            self.keys = prepare_keys(self.layout, rotation_mode, self.logger, self.stats)
+        self.stats.count("keys", len(self.keys))
+
+        # Index all footprints once, then check the keys and every footprint they need before anything is moved
+        with self.stats.phase("index_footprints"):
+            self.index_footprints()
+        self.stats.count("footprints_on_board", len(self.footprints))
+
+        if auto_match:
+            with self.stats.phase("match"):
+                self.match_keys(key_format)
+
+        # Switch number of every key, in the same order as the keys. Label 4 isn't checked yet: keys without a valid
+        # reference are left out here, and reported by validation before `numbers` are used to build the plan
+        numbers = self.matched_numbers if self.matched_numbers is not None else key_numbers(self.keys, rotation_mode)
+        if pair_footprints:
+            with self.stats.phase("pair"):
+                self.pair_footprints(key_format, stabilizer_format, diode_format, [number for number in numbers if number is not None], companion_formats)
+
+        with self.stats.phase("validate"):
+            problems = validate_placement(self.keys, self.footprints, key_format, stabilizer_format, diode_format, move_diodes,
+                                          relative_diode_mode, rotation_mode, matched_numbers=self.matched_numbers, pairing=self.pairing,
+                                          companion_formats=companion_formats)
+        if problems:
+            for problem in problems:
+                self.logger.error(problem)
+            raise ValidationError(problems)
+        first_key_start = time.perf_counter()
+
+
+        ### Now begin the placement of all keys based on new layout. ###
+
+        # Get information about the first key
+        first_key = self.get_footprint(key_format.format(1))
+        # The first key is the one referenced 1, the layout is sorted by reference in specific reference mode and when matching
+        specific_reference = rotation_mode or auto_match
+        # if first key is already rotated as it should be upon running the code, its position and offsets are measured accounting for its rotation
+        first_key_rotated = specific_reference and self.keys[0].rotation_angle != 0 and (first_key.GetOrientationDegrees() + self.keys[0].rotation_angle) in [0, 90, 180, -90]
+        first_key_pos = pcbnew.wxPoint(*layout_origin(self.keys[0], (first_key.GetPosition().x, first_key.GetPosition().y), self.key_distance, first_key_rotated))
+        self.logger.debug("first_key_pos %s", first_key_pos)
+        first_key_rotation = first_key.GetOrientationDegrees()
+
+        # Set the origin/reference as the first key
+        self.reference_coordinate = first_key_pos
+
+        # Set the default rotation to that of the first key's
+        first_key_already_rotated = False
+        if first_key_rotation != 0 and (first_key_rotation + self.keys[0].rotation_angle) in [0, 90, 180, -90]:
+            default_key_rotation = first_key_rotation + self.keys[0].rotation_angle
+            first_key_already_rotated = True
+        else:
+            default_key_rotation = first_key_rotation
+        self.logger.debug("default_key_rotation %s", default_key_rotation)
+
+        def first_of(reference_format, paired):
+            # Footprint of the first key with a reference format, or the one paired with the first switch
+            reference = paired.get(key_format.format(1)) if self.pairing is not None else reference_format.format(1)
+            return self.get_footprint(reference, required=False) if reference else None
+
+        # Get information about the first diode
+        first_diode = first_of(diode_format, self.pairing.diodes if self.pairing is not None else None)
+
+        # DEFAULTS
+        diode_offset = (0, 0) # nm
+        if relative_diode_mode:
+            diode_offset = self.relative_offset(first_key, first_diode, first_key_rotated)
+
+        # The first diode is only optional if diodes aren't moved at all (checked by validation)
+        # Set the default diode rotation to that of the first diode's
+        default_diode_rotation = self.relative_rotation(first_diode, first_key_already_rotated) if first_diode else 0
+
+        # Companions (e.g. LEDs, sockets) are placed like diodes: relative to the first key, as its own companion is
+        companions = []
+        for companion_format in companion_formats:
+            first_companion = first_of(companion_format, self.pairing.companions.get(companion_format, {}) if self.pairing is not None else None)
+            companions.append((self.relative_rotation(first_companion, first_key_already_rotated),
+                               self.relative_offset(first_key, first_companion, first_key_rotated)))
+
+        self.stats.add_time("first_key", time.perf_counter() - first_key_start)
+
+        # Plan the final pose of every footprint in one batch, then apply it
+        with self.stats.phase("plan"):
+            key_poses = plan_key_poses(self.keys, (self.reference_coordinate.x, self.reference_coordinate.y), self.key_distance,
+                                       default_key_rotation, default_diode_rotation, diode_offset, companions)
+            plan = build_plan(key_poses, numbers, key_format, stabilizer_format, diode_format, move_diodes,
+                              self.footprints.__contains__, self.pairing, companion_formats)
+
+        if dry_run:
+            self.stats.count("footprints_planned", len(plan))
+            self.logger.info("Planned %s keys: %s footprints (dry run, nothing was moved)", len(self.keys), len(plan))
+        else:
+            self.apply_plan(plan, incremental)
+            self.logger.info("Placed %s keys: moved %s footprints, skipped %s unchanged", len(self.keys), self.moved, self.skipped)
+        self.stats.count("lookups", self.footprints.lookups)
+        self.stats.finish()
+
+        return plan
@@ -1,32 +1,48 @@
 import pcbnew
-from pcbnew import BOARD, FOOTPRINT, VECTOR2I, wxPoint, EDA_ANGLE
 
 import wx
 import os
-import re
 import sys
-import json
 import logging
-from copy import deepcopy
-from math import sin, cos, radians, sqrt, atan, degrees
 
-from .serial import deserialize, Keyboard
-from .util import read_file, sort_keys_kle_placer, min_x_y, check_multilayout_keys
+from .key_placer import KeyPlacer
+from .layout_cache import LAYOUT_CACHE, CACHE_DIRECTORY, BackgroundLoad
+from .validation import ValidationError
+from .placement import PLAN_FILE_EXTENSION
+from .profiling import RunStats, profile_call
+from .logs import LOG_LEVELS, DEFAULT_LOG_LEVEL, start_file_logging, stop_file_logging
 
 class KeyAutoPlaceDialog(wx.Dialog):
-    def __init__(self, parent, title, caption):
+    def __init__(self, parent, title, caption, logger=None):
         style = wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER
         super(KeyAutoPlaceDialog, self).__init__(parent, -1, title, style=style)
+        self.logger = logger or logging.getLogger(__name__)
+        self.layout_load: BackgroundLoad = None # Layout being loaded (or loaded) in the background since it was picked
 
         # File select
         layout_select_box = wx.BoxSizer(wx.HORIZONTAL)
 
-        text = wx.StaticText(self, -1, "Select KLE json file:")
+        text = wx.StaticText(self, -1, "Select KLE json or raw data file:")
         layout_select_box.Add(text, 0, wx.LEFT|wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
 
         layout_file_picker = wx.FilePickerCtrl(self, -1)
         layout_select_box.Add(layout_file_picker, 1, wx.EXPAND|wx.ALL, 5)
 
+        # Layout status, filled in by the background load
+        layout_status_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        layout_status = wx.StaticText(self, -1, "")
+        layout_status_box.Add(layout_status, 1, wx.LEFT|wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+
+        # Saved plan select
+        plan_select_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        plan_text = wx.StaticText(self, -1, "Or apply a saved plan ({}) instead:".format(PLAN_FILE_EXTENSION))
+        plan_select_box.Add(plan_text, 0, wx.LEFT|wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+
+        plan_file_picker = wx.FilePickerCtrl(self, -1, wildcard="Placement plans (*{0})|*{0}".format(PLAN_FILE_EXTENSION))
+        plan_select_box.Add(plan_file_picker, 1, wx.EXPAND|wx.ALL, 5)
+
         # Key format
         key_format_box = wx.BoxSizer(wx.HORIZONTAL)
 
@@ -54,6 +70,15 @@ class KeyAutoPlaceDialog(wx.Dialog):
         diode_annotation_format = wx.TextCtrl(self, value='D{}')
         diode_format_box.Add(diode_annotation_format, 1, wx.EXPAND|wx.ALL, 5)
 
+        # Companion formats
+        companion_format_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        companionAnnotationLabel = wx.StaticText(self, -1, "Other per-key footprints, placed like diodes (e.g. LED{}, C{}):")
+        companion_format_box.Add(companionAnnotationLabel, 1, wx.LEFT|wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+
+        companion_annotation_formats = wx.TextCtrl(self, value='')
+        companion_format_box.Add(companion_annotation_formats, 1, wx.EXPAND|wx.ALL, 5)
+
         # Diode bool
         move_diodes_box = wx.BoxSizer(wx.HORIZONTAL)
 
@@ -75,32 +100,149 @@ class KeyAutoPlaceDialog(wx.Dialog):
         specific_ref_mode.SetValue(False)
         specific_ref_box.Add(specific_ref_mode, 1, wx.EXPAND|wx.ALL, 5)
 
+        # Auto-matching
+        auto_match_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        auto_match_bool = wx.CheckBox(self, label="Match keys to the nearest switches (by their current position on the board) instead of by reference")
+        auto_match_bool.SetValue(False)
+        auto_match_box.Add(auto_match_bool, 1, wx.EXPAND|wx.ALL, 5)
+
+        # Pairing
+        pair_footprints_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        pair_footprints_bool = wx.CheckBox(self, label="Move the diodes and stabilizers connected to (or else nearest to) each switch, for boards whose references don't line up")
+        pair_footprints_bool.SetValue(False)
+        pair_footprints_box.Add(pair_footprints_bool, 1, wx.EXPAND|wx.ALL, 5)
+
+        # Incremental mode
+        incremental_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        incremental_bool = wx.CheckBox(self, label="Only move footprints whose position changed since the last run")
+        incremental_bool.SetValue(False)
+        incremental_box.Add(incremental_bool, 1, wx.EXPAND|wx.ALL, 5)
+
+        # Save plan
+        save_plan_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        save_plan_bool = wx.CheckBox(self, label="Save the placement plan next to the board ({}), to reapply it without the KLE".format(PLAN_FILE_EXTENSION))
+        save_plan_bool.SetValue(False)
+        save_plan_box.Add(save_plan_bool, 1, wx.EXPAND|wx.ALL, 5)
+
+        # Layout cache
+        disk_cache_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        disk_cache_bool = wx.CheckBox(self, label="Cache parsed layouts on disk next to the project (in {})".format(CACHE_DIRECTORY))
+        disk_cache_bool.SetValue(False)
+        disk_cache_box.Add(disk_cache_bool, 1, wx.EXPAND|wx.ALL, 5)
+
+        # Profiling
+        profile_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        profile_bool = wx.CheckBox(self, label="Profile the run (saves keyautoplace.prof, for performance issues)")
+        profile_bool.SetValue(False)
+        profile_box.Add(profile_bool, 1, wx.EXPAND|wx.ALL, 5)
+
+        # Log level
+        log_level_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        log_level_label = wx.StaticText(self, -1, "Log level (keyautoplace.log):")
+        log_level_box.Add(log_level_label, 1, wx.LEFT|wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+
+        log_level_choice = wx.Choice(self, choices=list(LOG_LEVELS))
+        log_level_choice.SetStringSelection(DEFAULT_LOG_LEVEL)
+        log_level_box.Add(log_level_choice, 1, wx.EXPAND|wx.ALL, 5)
+
         # Final setup of box
         box = wx.BoxSizer(wx.VERTICAL)
 
         box.Add(layout_select_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(layout_status_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(plan_select_box, 0, wx.EXPAND|wx.ALL, 5)
         box.Add(key_format_box, 0, wx.EXPAND|wx.ALL, 5)
         box.Add(stab_format_box, 0, wx.EXPAND|wx.ALL, 5)
         box.Add(diode_format_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(companion_format_box, 0, wx.EXPAND|wx.ALL, 5)
         box.Add(move_diodes_box, 0, wx.EXPAND|wx.ALL, 5)
         box.Add(relative_diode_box, 0, wx.EXPAND|wx.ALL, 5)
         box.Add(specific_ref_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(auto_match_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(pair_footprints_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(incremental_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(save_plan_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(disk_cache_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(log_level_box, 0, wx.EXPAND|wx.ALL, 5)
+        box.Add(profile_box, 0, wx.EXPAND|wx.ALL, 5)
 
         buttons = self.CreateButtonSizer(wx.OK|wx.CANCEL)
         box.Add(buttons, 0, wx.EXPAND|wx.ALL, 5)
 
         self.SetSizerAndFit(box)
         self.layout_file_picker = layout_file_picker
+        self.layout_status = layout_status
+        self.plan_file_picker = plan_file_picker
         self.key_annotation_format = key_annotation_format
         self.stabilizer_annotation_format = stabilizer_annotation_format
         self.diode_annotation_format = diode_annotation_format
+        self.companion_annotation_formats = companion_annotation_formats
         self.move_diodes_bool = move_diodes_bool
         self.relative_diode_bool = relative_diode_bool
         self.specific_ref_mode = specific_ref_mode
+        self.auto_match_bool = auto_match_bool
+        self.pair_footprints_bool = pair_footprints_bool
+        self.incremental_bool = incremental_bool
+        self.save_plan_bool = save_plan_bool
+        self.disk_cache_bool = disk_cache_bool
+        self.log_level_choice = log_level_choice
+        self.profile_bool = profile_bool
+
+        # Start loading the layout as soon as it is picked, it is prepared differently in Specific Reference Mode
+        layout_file_picker.Bind(wx.EVT_FILEPICKER_CHANGED, self.on_layout_changed)
+        specific_ref_mode.Bind(wx.EVT_CHECKBOX, self.on_layout_changed)
+        auto_match_bool.Bind(wx.EVT_CHECKBOX, self.on_layout_changed)
+
+    def on_layout_changed(self, event):
+        event.Skip()
+        layout_path = self.get_layout_path()
+        if not layout_path:
+            return
+
+        cache_directory = CACHE_DIRECTORY if self.get_disk_cache_bool() else None
+        # The callback runs on the background thread, the dialog is only updated from the GUI thread
+        self.layout_load = BackgroundLoad(LAYOUT_CACHE, layout_path, self.get_specific_ref_mode_bool(), self.logger, cache_directory,
+                                          callback=lambda load: wx.CallAfter(self.on_layout_loaded, load), auto_match=self.get_auto_match_bool())
+        self.layout_status.SetLabel("Reading {}...".format(os.path.basename(layout_path)))
+        self.layout_load.start()
+
+    def on_layout_loaded(self, load: BackgroundLoad):
+        # Ignore loads of a previously picked layout, and loads that finish after the dialog was closed
+        if not self or load is not self.layout_load:
+            return
+
+        if load.error is not None:
+            status = "Could not read layout: {}".format(load.error)
+        elif load.problems:
+            status = "{} keys, {} problem(s): {}".format(len(load.keys), len(load.problems), load.problems[0])
+        else:
+            status = "{} keys, no problems found".format(len(load.keys))
+        self.layout_status.SetLabel(status)
+        self.layout_status.SetToolTip("\n".join(load.problems) if load.problems else status)
+        self.layout_status.Wrap(self.GetClientSize().width - 10)
+        self.Layout()
+
+    def get_prepared_keys(self):
+        """Keys loaded in the background for the current layout and options, waiting for the load if it is still running.
+        Returns None if the layout hasn't been loaded with the current options.
+        """
+        if self.layout_load is None or not self.layout_load.matches(self.get_layout_path(), self.get_specific_ref_mode_bool()):
+            return None
+        return self.layout_load.result()
 
     def get_layout_path(self):
         return self.layout_file_picker.GetPath()
 
+    def get_plan_path(self):
+        return self.plan_file_picker.GetPath()
+
     def get_key_annotation_format(self):
         return self.key_annotation_format.GetValue()
 
@@ -110,6 +252,9 @@ class KeyAutoPlaceDialog(wx.Dialog):
     def get_diode_annotation_format(self):
         return self.diode_annotation_format.GetValue()
 
+    def get_companion_annotation_formats(self):
+        return tuple(value.strip() for value in self.companion_annotation_formats.GetValue().split(",") if value.strip())
+
     def get_move_diodes_bool(self):
         return self.move_diodes_bool.GetValue()
     
@@ -119,363 +264,29 @@ class KeyAutoPlaceDialog(wx.Dialog):
     def get_specific_ref_mode_bool(self):
         return self.specific_ref_mode.GetValue()
 
-class BoardModifier():
-    def __init__(self, logger, board: BOARD):
-        self.logger = logger
-        self.board: BOARD = board
+    def get_auto_match_bool(self):
+        return self.auto_match_bool.GetValue()
 
-    def mm_to_nm(self, v):
-        return int(v * 1000000)
-    
-    def nm_to_mm(self, v):
-        return v / 1000000.0
-
-    def get_footprint(self, reference, required=True) -> FOOTPRINT:
-        self.logger.info("Searching for {} footprint".format(reference))
-        footprint = self.board.FindFootprintByReference(reference)
-        if footprint is None and required:
-            self.logger.error("Footprint not found")
-            raise Exception("Cannot find footprint {}".format(reference))
-        return footprint
-
-    def set_position(self, footprint: FOOTPRINT, position: wxPoint):
-        self.logger.info("Setting {} footprint position: {}".format(footprint.GetReference(), position))
-        footprint.SetPosition(VECTOR2I(int(position.x), int(position.y)))
-
-    def set_relative_position_mm(self, footprint, referencePoint, direction):
-        position = pcbnew.wxPoint(referencePoint.x + pcbnew.FromMM(direction[0]), referencePoint.y + pcbnew.FromMM(direction[1]))
-        self.set_position(footprint, position)
-
-    def rotate(self, footprint: FOOTPRINT, rotationReference, angle):
-        self.logger.info("Rotating {} footprint: rotationReference: {}, rotationAngle: {}".format(footprint.GetReference(), rotationReference, angle))
-        footprint.Rotate(VECTOR2I(int(rotationReference.x), int(rotationReference.y)), EDA_ANGLE(angle*-1, pcbnew.DEGREES_T))
-
-
-class KeyPlacer(BoardModifier):
-    def __init__(self, logger, board: BOARD, layout):
-        super().__init__(logger, board)
-        self.layout: Keyboard = layout
-        self.key_distance = pcbnew.FromMM(19.05)
-        self.current_key = 1
-        self.current_diode = 1
-        self.reference_coordinate = pcbnew.wxPoint(pcbnew.FromMM(25), pcbnew.FromMM(25))
-
-    def get_current_key(self, key_format, stabilizer_format):
-        key = self.get_footprint(key_format.format(self.current_key))
-
-        # in case of perigoso/keyswitch-kicad-library, stabilizer holes are not part of of switch footprint and needs to be handled
-        # separately, check if there is stabilizer with id matching current key and return it
-        # stabilizer will be None if not found
-        stabilizer = self.get_footprint(stabilizer_format.format(self.current_key), required=False)
-        self.current_key += 1
-
-        return key, stabilizer
-
-    # def get_current_diode(self, diode_format):
-    #     diode = self.get_footprint(diode_format.format(self.current_diode))
-    #     self.current_diode += 1
-    #     return diode
-
-    def squish_kbd_multilayout(self):
-        kbd = deepcopy(self.layout)
-        self.logger.info(kbd.keys)
-        ml_keys = check_multilayout_keys(kbd)
-
-        # This list will replace kbd.keys later
-        # It is a list with only the keys to be included in the info.json
-        temp_layout = [] 
-        # Add non-multilayout keys to the list for now
-        for key in [k for k in kbd.keys if k not in ml_keys]:
-            temp_layout.append(key)
-
-
-        # Generate a dict of all multilayouts
-        # E.g. Used to test and figure out the multilayout value with the maximum amount of keys
-        ml_dict = {}
-        for key in [k for k in kbd.keys if k in ml_keys]:
-            ml_ndx = int(key.labels[3])
-            ml_val = int(key.labels[5])
-
-            # Create dict with multilayout index if it doesn't exist
-            if not ml_ndx in ml_dict.keys():
-                ml_dict[ml_ndx] = {}
-
-            # Create dict with multilayout value if it doesn't exist
-            # Also create list of keys if it doesn't exist
-            if not ml_val in ml_dict[ml_ndx].keys():
-                ml_dict[ml_ndx][ml_val] = []
-
-            # Add key to dict if not in already
-            if not key in ml_dict[ml_ndx][ml_val]:
-                ml_dict[ml_ndx][ml_val].append(key)
-
-
-        # Iterate over multilayout keys
-        for key in [k for k in kbd.keys if k in ml_keys]:
-            # WIP: Be able to configure this
-            ml_ndx = int(key.labels[3])
-            ml_val = int(key.labels[5])
-
-            # list of all amount of keys over all val options
-            ml_val_length_list = [len(ml_dict[ml_ndx][i]) for i in ml_dict[ml_ndx].keys() if isinstance(i, int)]
-            max_val_len = max(ml_val_length_list) # maximum amount of keys over all val options
-            current_val_len = len(ml_dict[ml_ndx][ml_val]) # amount of keys in current val
-            current_is_max = max_val_len == current_val_len
-
-            # If all multilayout values/options have the same amount of keys
-            all_same_length = len(set(ml_val_length_list)) == 1
-
-            if not "max" in ml_dict[ml_ndx].keys():
-                if all_same_length:
-                    ml_dict[ml_ndx]["max"] = 0 # Use the default
-                elif current_is_max:
-                    ml_dict[ml_ndx]["max"] = ml_val
-
-            # If the current multilayout value/option isn't default,
-            if ml_val > 0:
-                # Check if there is an offsets dict
-                if not "offsets" in ml_dict[ml_ndx].keys():
-                    ml_dict[ml_ndx]["offsets"] = {}
-
-                # Check if the offset for this multilayout value has been calculated yet.
-                if not ml_val in ml_dict[ml_ndx]["offsets"].keys():
-                    # If not, calculate and set the offset
-                    xmin, ymin = min_x_y(ml_dict[ml_ndx][0])
-                    x, y = min_x_y(ml_dict[ml_ndx][ml_val])
-
-                    ml_x_offset = xmin - x
-                    ml_y_offset = ymin - y
-
-                    ml_dict[ml_ndx]["offsets"][ml_val] = (ml_x_offset, ml_y_offset)
-                else:
-                    # If so, just get the offset from ml_dict
-                    ml_x_offset, ml_y_offset = ml_dict[ml_ndx]["offsets"][ml_val]
-                
-                # Offset the x and y values
-                key.x += ml_x_offset
-                key.y += ml_y_offset
-
-            # (For multilayouts) make sure there isn't any of the same overlapping keys
-            if not any([ (key.x + (key.width/2) == a.x + (a.width/2) and key.y + (key.height/2) == a.y + (a.height/2)) for a in temp_layout]):
-                # Add the key to the final list
-                temp_layout.append(key)
-
-        # Offset all the remaining keys (align against the top left)
-        x_offset, y_offset = min_x_y(temp_layout)
-        for key in temp_layout:
-            key.x -= x_offset
-            key.y -= y_offset
-            
-            if key.rotation_angle:
-                key.rotation_x -= x_offset
-                key.rotation_y -= y_offset
-
-        # Override primary layout with temporary layout
-        self.layout.keys = temp_layout
-
-        # Sort keys based on the centers of each key (by default it sorts with the top left corner)
-        sort_keys_kle_placer(self.layout.keys)
-
-    def Run(self, key_format, stabilizer_format, diode_format, move_diodes, relative_diode_mode, rotation_mode):
-
-        ### First, check all the multilayouts and squish all the same multilayouts into the same position on top of one another. ###
-
-        self.squish_kbd_multilayout()
-
-        # Check for violations of KLE guidelines
-        if any([not key.labels[4].isdigit() for key in self.layout.keys]) and rotation_mode:
-            raise Exception("You need to provide a reference for every switch (label 4) if using rotation mode!")
-
-        if any([key.rotation_angle != 0 for key in self.layout.keys]) and not rotation_mode:
-            raise Exception("You must enable rotation mode if there are any rotated keys!")
-
-
-        ### Now begin the placement of all keys based on new layout. ###
-
-        # Get information about the first key
-        first_key = self.get_footprint(key_format.format(1))
-        if rotation_mode: # Sort layout by reference if using specific reference mode
-            def check(key):
-                return int(key.labels[4])
-            self.layout.keys.sort(key=lambda x:check(x))
-            # if first key is already rotated as it should be upon running the code, use maths to get the reference point, accounting for rotation:
-            if self.layout.keys[0].rotation_angle != 0 and (first_key.GetOrientationDegrees() + self.layout.keys[0].rotation_angle) in [0, 90, 180, -90]:
-                r = self.layout.keys[0].rotation_angle
-                w = self.layout.keys[0].width
-                h = self.layout.keys[0].height
-                rx = self.layout.keys[0].rotation_x
-                ry = self.layout.keys[0].rotation_y
-
-                u = self.key_distance
-                pos = first_key.GetPosition()
-
-                lx = w/2
-                ly = h/2
-                l = sqrt( pow(lx, 2) + pow(ly, 2) ) * u
-                theta = degrees(atan(ly/lx))
-                alpha = 180 - ( 90 + r + theta )
-                self.logger.info("l {}".format(l))
-                self.logger.info("theta {}".format(theta))
-                self.logger.info("alpha {}".format(alpha))
-
-                dif_x = sin(radians(alpha)) * l
-                dif_y = cos(radians(alpha)) * l
-                self.logger.info("dif_x {}".format(dif_x))
-                self.logger.info("dif_y {}".format(dif_y))
-
-
-                x = pos.x
-                y = pos.y
-                self.logger.info("x {}".format(x))
-                self.logger.info("y {}".format(y))
-
-                xc = x - dif_x - rx * u
-                yc = y - dif_y - ry * u
-                self.logger.info("xc {}".format(xc))
-                self.logger.info("yc {}".format(yc))
-
-                top_left = pcbnew.wxPoint(xc , yc)
-                first_key_pos = top_left
-
-                #self.set_position(first_key,  pcbnew.wxPoint(xc, yc))
-            else:
-                first_key_pos = pcbnew.wxPoint((first_key.GetPosition().x) - ((self.key_distance * self.layout.keys[0].x) + (self.key_distance * self.layout.keys[0].width // 2)),
-                        (first_key.GetPosition().y) - ((self.key_distance * self.layout.keys[0].y) + (self.key_distance * self.layout.keys[0].height // 2)))
-        else:
-            first_key_pos = pcbnew.wxPoint((first_key.GetPosition().x) - ((self.key_distance * self.layout.keys[0].x) + (self.key_distance * self.layout.keys[0].width // 2)),
-                    (first_key.GetPosition().y) - ((self.key_distance * self.layout.keys[0].y) + (self.key_distance * self.layout.keys[0].height // 2)))
-        
-        self.logger.info("first_key_pos {}".format(first_key_pos))
-        first_key_rotation = first_key.GetOrientationDegrees()
-
-        # Set the origin/reference as the first key
-        self.reference_coordinate = first_key_pos
-
-        # Set the default rotation to that of the first key's
-        first_key_already_rotated = False
-        if first_key_rotation != 0 and (first_key_rotation + self.layout.keys[0].rotation_angle) in [0, 90, 180, -90]:
-            default_key_rotation = first_key_rotation + self.layout.keys[0].rotation_angle
-            first_key_already_rotated = True
-        else:
-            default_key_rotation = first_key_rotation
-        self.logger.info("default_key_rotation {}".format(default_key_rotation))
-
-        # Get information about the first diode
-        first_diode = self.get_footprint(diode_format.format(1), required=False) or None
-
-        # Make sure there is a first diode if relative diode is enabled
-        if not first_diode and relative_diode_mode:
-            raise Exception("First key requires a diode!")
-
-        # DEFAULTS
-        diode_offset_x = 0 # mm
-        diode_offset_y = 0 # mm
-
-        if relative_diode_mode:
-            # if first key is already rotated as it should be upon running the code, use maths to get the proper diode offset, accounting for rotation:
-            if rotation_mode and self.layout.keys[0].rotation_angle != 0 and (first_key.GetOrientationDegrees() + self.layout.keys[0].rotation_angle) in [0, 90, 180, -90]:
-                mx = abs(first_diode.GetPosition().x - first_key.GetPosition().x)
-                my = abs(first_diode.GetPosition().y - first_key.GetPosition().y)
-                ml = sqrt(pow(mx, 2) + pow(my, 2))
-                beta = degrees(atan(my/mx))
-                z = 90 - beta - r  # r from earlier
-                self.logger.info("mx {}".format(mx))
-                self.logger.info("my {}".format(my))
-                self.logger.info("ml {}".format(ml))
-                self.logger.info("beta {}".format(beta))
-                self.logger.info("z {}".format(z))
-
-                ox = sin(radians(z)) * ml
-                oy = cos(radians(z)) * ml
-                self.logger.info("ox {}".format(ox))
-                self.logger.info("oy {}".format(oy))
-
-                diode_offset_x = self.nm_to_mm(ox)
-                diode_offset_y = self.nm_to_mm(oy)
-            else:
-                diode_offset_x = self.nm_to_mm(first_diode.GetPosition().x - first_key.GetPosition().x)
-                diode_offset_y = self.nm_to_mm(first_diode.GetPosition().y - first_key.GetPosition().y)
-        
-        first_diode_rotation = first_diode.GetOrientationDegrees()
-        if first_key_already_rotated:
-            first_diode_rotation += self.layout.keys[0].rotation_angle
-
-        # Set the default diode rotation to that of the first diode's
-        default_diode_rotation = first_diode_rotation
-
-        # Start placement of keys
-        for key in self.layout.keys:
-            if rotation_mode:
-                current_ref = int(key.labels[4]) # Already checked for violations earlier
-                # if current_ref == 1:
-                #     continue
-                self.current_key = current_ref
-
-            # Get the diode, switch and stabilizer footprints
-            diode_footprint = self.get_footprint(diode_format.format(self.current_key), required=False) or None
-            switch_footprint, stabilizer = self.get_current_key(key_format, stabilizer_format)
-
-            # Extra individual switch rotations i.e. extra rotation compared to the first switch's rotation e.g. for south/north facing switches
-            extra_switch_rotation = 0
-            if key.labels[10].isdigit():
-                extra_switch_rotation = int(key.labels[10])
-
-            # Whether or not to flip the stablizer footprint
-            flip_stabilizer = False
-            if key.labels[9].lower() == 'f':
-                flip_stabilizer = True
-
-            # Shortcuts
-            width = key.width
-            height = key.height
-            angle = key.rotation_angle
-
-            # Calculate position on board
-            position = pcbnew.wxPoint((self.key_distance * key.x) + (self.key_distance * width // 2),
-                (self.key_distance * key.y) + (self.key_distance * height // 2)) + self.reference_coordinate
-            
-            # Move switch footprint
-            self.set_position(switch_footprint, position)
-
-            # Set rotation of switch to the same as the first one, then rotate extra based if needed
-            switch_footprint.SetOrientationDegrees(default_key_rotation) 
-            if extra_switch_rotation: 
-                self.rotate(switch_footprint, switch_footprint.GetPosition(), extra_switch_rotation)
-
-            # Move (and rotate) diode if it exists, and Move Diode is enabled
-            if diode_footprint and move_diodes:
-                self.set_relative_position_mm(diode_footprint, position, [diode_offset_x, diode_offset_y])
-                diode_footprint.SetOrientationDegrees(default_diode_rotation)
-                self.rotate(diode_footprint, switch_footprint.GetPosition(), extra_switch_rotation)
-
-            # Move stabilizer if it exists
-            if stabilizer:
-                stabilizer.SetOrientationDegrees(0)
-                self.set_position(stabilizer, position)
-
-                if flip_stabilizer:
-                    stabilizer.SetOrientationDegrees(180)
-
-            # For angled keys (should only apply when rotation mode is enabled)
-            if angle != 0:
-                rotation_reference = pcbnew.wxPoint((self.key_distance * key.rotation_x), (self.key_distance * key.rotation_y)) + self.reference_coordinate
-                self.logger.info("rotation_reference {}".format(rotation_reference))
-                self.rotate(switch_footprint, rotation_reference, angle)
-
-                if diode_footprint and move_diodes:
-                    self.rotate(diode_footprint, rotation_reference, angle)
-
-                if stabilizer:
-                    self.rotate(stabilizer, rotation_reference, angle)
-
-
-class KLEPlacerAction(pcbnew.ActionPlugin):
-    def defaults(self):
-        self.name = "KLE Placer"
-        self.category = "Utility"
-        self.description = "Places switches down in a kicad project based on "
-        self.show_toolbar_button = True # Optional, defaults to False
-        # self.icon_file_name = os.path.join(os.path.dirname(__file__), 'icon.png') # Optional
+    def get_pair_footprints_bool(self):
+        return self.pair_footprints_bool.GetValue()
+
+    def get_incremental_bool(self):
+        return self.incremental_bool.GetValue()
+
+    def get_save_plan_bool(self):
+        return self.save_plan_bool.GetValue()
+
+    def get_disk_cache_bool(self):
+        return self.disk_cache_bool.GetValue()
+
+    def get_profile_bool(self):
+        return self.profile_bool.GetValue()
+
+    def get_log_level(self):
+        return LOG_LEVELS.get(self.log_level_choice.GetStringSelection(), LOG_LEVELS[DEFAULT_LOG_LEVEL])
+
+class KLEPlacerRun():
+    """Everything the action plugin (see `action_plugin.KLEPlacerAction`) does once its button is pressed."""
 
     def Initialize(self):
         self.board = pcbnew.GetBoard()
@@ -483,35 +294,64 @@ class KLEPlacerAction(pcbnew.ActionPlugin):
         # go to the project folder - so that log will be in proper place
         os.chdir(os.path.dirname(os.path.abspath(self.board.GetFileName())))
 
-        # Remove all handlers associated with the root logger object.
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-
-        # set up logger
-        logging.basicConfig(level=logging.DEBUG,
-                            filename="keyautoplace.log",
-                            filemode='w',
-                            format='%(asctime)s %(name)s %(lineno)d: %(message)s',
-                            datefmt='%H:%M:%S')
+        # set up logger, the log file is written on a background thread so logging doesn't slow down placement
+        self.log_listener = start_file_logging("keyautoplace.log", LOG_LEVELS[DEFAULT_LOG_LEVEL])
         self.logger = logging.getLogger(__name__)
-        self.logger.info("Plugin executed with python version: " + repr(sys.version))
 
 
+    def place(self, dlg, layout_path, plan_path):
+        stats = RunStats()
+        try:
+            if plan_path:
+                # A saved plan is applied as is, the KLE and placement options aren't needed
+                placer = KeyPlacer(self.logger, self.board, None, stats=stats)
+                plan = placer.apply_plan_file(plan_path, dlg.get_incremental_bool())
+            else:
+                # Usually the layout was already loaded in the background while the dialog was open
+                keys = dlg.get_prepared_keys()
+                if keys is not None:
+                    stats.count("layout_loaded_in_background")
+                else:
+                    # Parsed layouts are cached for the session, re-running on an unchanged layout skips parsing
+                    cache_directory = CACHE_DIRECTORY if dlg.get_disk_cache_bool() else None
+                    keys = LAYOUT_CACHE.load(layout_path, dlg.get_specific_ref_mode_bool(), self.logger, cache_directory, stats)
+
+                self.logger.debug("User layout: %s", keys)
+                placer = KeyPlacer(self.logger, self.board, None, keys, stats=stats)
+                plan = placer.Run(dlg.get_key_annotation_format(), dlg.get_stabilizer_annotation_format(), dlg.get_diode_annotation_format(), dlg.get_move_diodes_bool(), dlg.get_relative_diode_bool(), dlg.get_specific_ref_mode_bool(), dlg.get_incremental_bool(),
+                                   auto_match=dlg.get_auto_match_bool(), pair_footprints=dlg.get_pair_footprints_bool(),
+                                   companion_formats=dlg.get_companion_annotation_formats())
+
+            if dlg.get_save_plan_bool():
+                placer.save_plan_file(plan, os.path.splitext(os.path.basename(self.board.GetFileName()))[0] + PLAN_FILE_EXTENSION)
+        except ValidationError as e:
+            # Nothing was moved, show every problem at once so they can all be fixed before the next run
+            wx.MessageBox(str(e), "KLE Placer", wx.OK|wx.ICON_ERROR)
+        finally:
+            # Phase timings and counters of the run, written next to the log (also for failed runs)
+            stats.finish()
+            stats.write("keyautoplace_report.json", board=self.board.GetFileName(), layout=plan_path or layout_path)
+
     def Run(self):
         self.Initialize()
 
         pcbFrame = [x for x in wx.GetTopLevelWindows() if x.GetName() == 'PcbFrame'][0]
 
-        dlg = KeyAutoPlaceDialog(pcbFrame, 'Title', 'Caption')
-        if dlg.ShowModal() == wx.ID_OK:
-            
-            layout_path = dlg.get_layout_path()
-            if layout_path:
-                self.layout = deserialize(json.loads(read_file(layout_path)))
-            
-                self.logger.info("User layout: {}".format(self.layout))
-                placer = KeyPlacer(self.logger, self.board, self.layout)
-                placer.Run(dlg.get_key_annotation_format(), dlg.get_stabilizer_annotation_format(), dlg.get_diode_annotation_format(), dlg.get_move_diodes_bool(), dlg.get_relative_diode_bool(), dlg.get_specific_ref_mode_bool())
-
-        dlg.Destroy()
-        logging.shutdown()
+        try:
+            dlg = KeyAutoPlaceDialog(pcbFrame, 'Title', 'Caption', self.logger)
+            if dlg.ShowModal() == wx.ID_OK:
+                logging.root.setLevel(dlg.get_log_level())
+                self.logger.debug("Plugin executed with python version: %r", sys.version)
+
+                layout_path = dlg.get_layout_path()
+                plan_path = dlg.get_plan_path()
+                if layout_path or plan_path:
+                    if dlg.get_profile_bool():
+                        profile_call("keyautoplace.prof", self.place, dlg, layout_path, plan_path)
+                    else:
+                        self.place(dlg, layout_path, plan_path)
+
+            dlg.Destroy()
+        finally:
+            # Write out everything still queued for the log file, even if placement failed
+            stop_file_logging(self.log_listener)
@@ -0,0 +1,166 @@
+import logging
+from dataclasses import replace
+
+from .serial import Key, Keyboard
+from .util import min_x_y, is_multilayout_key, sort_keys_kle_placer
+from .profiling import RunStats
+from .validation import ValidationError, check_multilayouts
+
+class PlacerKey():
+    """Compact stand-in for `serial.Key` with only the fields the placer reads.
+
+    Keeps a reference to the `Key` it was made from, so converting back with `to_key` is lossless.
+    `labels` is a tuple shared between all keys with the same labels.
+    """
+    __slots__ = ("x", "y", "width", "height", "rotation_x", "rotation_y", "rotation_angle", "labels", "key")
+
+    def __init__(self, key: Key, labels: tuple, x_offset: float = 0, y_offset: float = 0):
+        self.x = key.x + x_offset if x_offset else key.x
+        self.y = key.y + y_offset if y_offset else key.y
+        self.width = key.width
+        self.height = key.height
+        self.rotation_x = key.rotation_x
+        self.rotation_y = key.rotation_y
+        self.rotation_angle = key.rotation_angle
+        self.labels = labels
+        self.key = key
+
+    def to_key(self) -> Key:
+        """Returns a copy of the original `Key` with this key's (possibly moved) geometry."""
+        return replace(self.key, x=self.x, y=self.y, width=self.width, height=self.height, rotation_x=self.rotation_x,
+                       rotation_y=self.rotation_y, rotation_angle=self.rotation_angle, labels=list(self.labels))
+
+    def __repr__(self):
+        return "PlacerKey(x={}, y={}, width={}, height={}, rotation_angle={}, labels={})".format(
+            self.x, self.y, self.width, self.height, self.rotation_angle, self.labels)
+
+def to_placer_keys(keys: list) -> list:
+    """Converts `serial.Key`s to `PlacerKey`s, interning identical label tuples."""
+    labels_table = {}
+    placer_keys = []
+    for key in keys:
+        labels = tuple(key.labels)
+        placer_keys.append(PlacerKey(key, labels_table.setdefault(labels, labels)))
+    return placer_keys
+
+def to_keys(placer_keys: list) -> list:
+    return [placer_key.to_key() for placer_key in placer_keys]
+
+class MultilayoutView():
+    """The keys left after squishing multilayouts, plus the offset (in units) that moves each one
+    onto the default multilayout value/option. Only references the parsed keys, nothing is copied or changed.
+    """
+    def __init__(self):
+        self.keys = []
+        self.offsets = []
+
+    def add(self, key: Key, offset=(0, 0)):
+        self.keys.append(key)
+        self.offsets.append(offset)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def to_placer_keys(self) -> list:
+        """Creates `PlacerKey`s for the selected keys only, offset and aligned against the top left."""
+        labels_table = {}
+        placer_keys = []
+        for key, (x_offset, y_offset) in zip(self.keys, self.offsets):
+            labels = tuple(key.labels)
+            placer_keys.append(PlacerKey(key, labels_table.setdefault(labels, labels), x_offset, y_offset))
+
+        # Offset all the remaining keys (align against the top left)
+        x_offset, y_offset = min_x_y(placer_keys)
+        for key in placer_keys:
+            key.x -= x_offset
+            key.y -= y_offset
+
+            if key.rotation_angle:
+                key.rotation_x -= x_offset
+                key.rotation_y -= y_offset
+
+        return placer_keys
+
+def squish_multilayouts(keys: list, logger) -> MultilayoutView:
+    """Squishes all multilayout values/options on top of the default one, keeping one key per position.
+    Returns a view of the keys to place, `keys` are not modified.
+    """
+    view = MultilayoutView()
+    ml_keys = []
+
+    # Group all multilayouts by index then value, in the order they first appear, starting the view with all non-multilayout keys
+    # E.g. Used to figure out the multilayout value with the maximum amount of keys
+    ml_dict = {}
+    for key in keys:
+        if not is_multilayout_key(key):
+            view.add(key)
+            continue
+        ml_keys.append(key)
+        ml_dict.setdefault(int(key.labels[3]), {}).setdefault(int(key.labels[5]), []).append(key)
+
+    # Calculate the offset of every non-default multilayout value/option once, relative to the default (0)
+    ml_offsets = {}
+    for ml_ndx, ml_vals in ml_dict.items():
+        ml_val_length_list = [len(ml_val_keys) for ml_val_keys in ml_vals.values()]
+        max_val_len = max(ml_val_length_list) # maximum amount of keys over all val options
+        if len(set(ml_val_length_list)) == 1:
+            max_val = 0 # All options have the same amount of keys, use the default
+        else:
+            max_val = next(ml_val for ml_val, ml_val_keys in ml_vals.items() if len(ml_val_keys) == max_val_len)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Multilayout %s: keys per value %s, value with the most keys %s",
+                         ml_ndx, dict(zip(ml_vals.keys(), ml_val_length_list)), max_val)
+
+        if not any(ml_val > 0 for ml_val in ml_vals):
+            continue
+        if 0 not in ml_vals:
+            raise Exception("Multilayout {} has no default value/option (0)".format(ml_ndx))
+
+        xmin, ymin = min_x_y(ml_vals[0])
+        for ml_val, ml_val_keys in ml_vals.items():
+            if ml_val > 0:
+                x, y = min_x_y(ml_val_keys)
+                ml_offsets[(ml_ndx, ml_val)] = (xmin - x, ymin - y)
+
+    # Centres of all keys selected so far, to find overlapping multilayout keys without comparing against every key
+    centres = {(key.x + (key.width/2), key.y + (key.height/2)) for key in view.keys}
+
+    for key in ml_keys:
+        # Offset the key if its multilayout value/option isn't default
+        x_offset, y_offset = ml_offsets.get((int(key.labels[3]), int(key.labels[5])), (0, 0))
+        x = key.x + x_offset if x_offset else key.x
+        y = key.y + y_offset if y_offset else key.y
+
+        # (For multilayouts) make sure there isn't any of the same overlapping keys
+        centre = (x + (key.width/2), y + (key.height/2))
+        if centre not in centres:
+            centres.add(centre)
+            view.add(key, (x_offset, y_offset))
+
+    return view
+
+def prepare_keys(layout: Keyboard, rotation_mode: bool, logger, stats: RunStats = None) -> list:
+    """Squishes the multilayouts of a parsed layout, then sorts the keys that are left, ready to be placed.
+    Only depends on the layout and `rotation_mode` (Specific Reference Mode), so the result can be cached.
+    The keys themselves are checked together with the board before placing, see `validation.validate_placement`.
+    Only multilayouts without a default value/option are reported here, on their own, as they can't be squished.
+    """
+    stats = stats if stats is not None else RunStats()
+
+    # Multilayouts can't be squished without a default value/option
+    problems = check_multilayouts(layout.keys)
+    if problems:
+        raise ValidationError(problems)
+
+    with stats.phase("squish"):
+        keys = squish_multilayouts(layout.keys, logger).to_placer_keys()
+
+    # Sort keys based on the centers of each key (by default it sorts with the top left corner)
+    with stats.phase("sort"):
+        sort_keys_kle_placer(keys)
+
+    # Sort layout by reference if using specific reference mode (keys without a reference are reported by validation)
+    if rotation_mode and all(key.labels[4].isdigit() for key in keys):
+        keys.sort(key=lambda key: int(key.labels[4]))
+
+    return keys
@@ -0,0 +1,185 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .serial import Key
+from .layout import PlacerKey, prepare_keys
+from .util import parse_layout
+from .profiling import RunStats
+from .validation import check_keys
+
+CACHE_VERSION = 1
+CACHE_DIRECTORY = ".kle_placer_cache"
+
+class LayoutCache():
+    """Size-bounded cache of prepared layouts (parsed, squished, sorted and checked keys),
+    keyed by a hash of the KLE file content and the options that change how it is prepared.
+
+    Entries are kept in memory (least recently used are evicted first) and, if a directory is given
+    to `load`, also written there as small json files so they survive restarting KiCad.
+
+    Loads are serialized with a lock, so loading a layout that is still being parsed on another thread
+    (see `BackgroundLoad`) waits for that parse and then hits the cache, instead of parsing it twice.
+    """
+    def __init__(self, max_entries: int = 8, max_disk_entries: int = 16):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def cache_key(self, content: bytes, rotation_mode: bool) -> str:
+        digest = hashlib.sha256(content)
+        digest.update("v{} rotation_mode={}".format(CACHE_VERSION, bool(rotation_mode)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def load(self, path: str, rotation_mode: bool, logger, directory: str = None, stats: RunStats = None) -> list:
+        """Returns the prepared keys of the KLE json at `path`, only parsing it if it isn't cached yet."""
+        with self.lock:
+            return self._load(path, rotation_mode, logger, directory, stats)
+
+    def _load(self, path: str, rotation_mode: bool, logger, directory: str = None, stats: RunStats = None) -> list:
+        stats = stats if stats is not None else RunStats()
+        with stats.phase("read_layout"):
+            with open(path, "rb") as file:
+                content = file.read()
+            key = self.cache_key(content, rotation_mode)
+
+        keys = self.entries.get(key)
+        if keys is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            stats.count("layout_cache_hits")
+            logger.debug("Layout cache hit for %s (memory)", path)
+            return list(keys)
+
+        keys = None
+        if directory:
+            with stats.phase("read_layout_cache"):
+                keys = self.read_disk_entry(directory, key, logger)
+        if keys is not None:
+            self.hits += 1
+            stats.count("layout_cache_hits")
+            logger.debug("Layout cache hit for %s (disk)", path)
+        else:
+            self.misses += 1
+            stats.count("layout_cache_misses")
+            logger.debug("Layout cache miss for %s, parsing", path)
+            with stats.phase("deserialize"):
+                layout = parse_layout(content.decode("utf-8"))
+            keys = prepare_keys(layout, rotation_mode, logger, stats)
+            if directory:
+                with stats.phase("write_layout_cache"):
+                    self.write_disk_entry(directory, key, keys, logger)
+
+        self.entries[key] = keys
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return list(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def read_disk_entry(self, directory: str, key: str, logger) -> list:
+        # Any entry that can't be read back (e.g. written by another version, or damaged) is a miss, the layout is parsed again then
+        path = os.path.join(directory, key + ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return None
+
+        # Only the fields the placer reads are stored, so the source keys are rebuilt from those (with default colours etc.)
+        keys = []
+        try:
+            for x, y, width, height, rotation_x, rotation_y, rotation_angle, labels in data["keys"]:
+                if not all(isinstance(value, (int, float)) for value in (x, y, width, height, rotation_x, rotation_y, rotation_angle)) \
+                        or not isinstance(labels, list) or len(labels) != 12 or not all(isinstance(label, str) for label in labels):
+                    raise ValueError("malformed key")
+                key = Key(labels=labels, x=x, y=y, width=width, height=height, rotation_x=rotation_x, rotation_y=rotation_y, rotation_angle=rotation_angle)
+                keys.append(PlacerKey(key, tuple(labels)))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug("Ignoring malformed layout cache entry %s: %s", path, e)
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError as e:
+            logger.debug("Could not mark layout cache entry %s as used: %s", path, e)
+        logger.debug("Read %s cached keys from %s", len(keys), path)
+        return keys
+
+    def write_disk_entry(self, directory: str, key: str, keys: list, logger):
+        try:
+            os.makedirs(directory, exist_ok=True)
+            data = {
+                "version": CACHE_VERSION,
+                "keys": [[k.x, k.y, k.width, k.height, k.rotation_x, k.rotation_y, k.rotation_angle, list(k.labels)] for k in keys],
+            }
+            with open(os.path.join(directory, key + ".json"), "w", encoding="utf-8") as file:
+                json.dump(data, file, separators=(",", ":"))
+
+            # Only keep the most recently used entries
+            entries = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")]
+            entries.sort(key=os.path.getmtime, reverse=True)
+            for entry in entries[self.max_disk_entries:]:
+                os.remove(entry)
+        except OSError as e:
+            # The cache is only an optimization, never fail a run because of it
+            logger.warning("Could not write layout cache to %s: %s", directory, e)
+
+class BackgroundLoad():
+    """Loads (parses, squishes and sorts) a layout through a `LayoutCache` on a background thread, then checks the keys
+    (see `validation.check_keys`), so a layout can be prepared while the user is still filling in the dialog.
+    `callback(load)` is called on the background thread once it is done, whether it failed or not.
+    """
+    def __init__(self, cache: LayoutCache, path: str, rotation_mode: bool, logger, directory: str = None, callback=None, auto_match: bool = False):
+        self.cache = cache
+        self.path = path
+        self.rotation_mode = bool(rotation_mode)
+        self.auto_match = auto_match
+        self.logger = logger
+        self.directory = directory
+        self.callback = callback
+        self.keys = None
+        self.problems = []
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="kle-placer-layout-load", daemon=True)
+
+    def start(self) -> "BackgroundLoad":
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.keys = self.cache.load(self.path, self.rotation_mode, self.logger, self.directory)
+            self.problems = check_keys(self.keys, self.rotation_mode, self.auto_match)
+        except Exception as e:
+            self.error = e
+            self.logger.warning("Could not load layout %s: %s", self.path, e)
+        finally:
+            if self.callback is not None:
+                self.callback(self)
+
+    def done(self) -> bool:
+        return not self.thread.is_alive()
+
+    def matches(self, path: str, rotation_mode: bool) -> bool:
+        return self.path == path and self.rotation_mode == bool(rotation_mode)
+
+    def result(self) -> list:
+        """Waits for the load to finish and returns the prepared keys, raising whatever error the load raised."""
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return list(self.keys)
+
+# Kept for the whole KiCad session, since plugin modules are only imported once
+LAYOUT_CACHE = LayoutCache()
@@ -0,0 +1,50 @@
+import queue
+import logging
+import logging.handlers
+
+LOG_FORMAT = '%(asctime)s %(name)s %(lineno)d: %(message)s'
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+# Log levels to choose from in the dialog, from least to most verbose.
+# Summary logs one line per run, Debug logs every footprint and every step of the rotation maths.
+LOG_LEVELS = {
+    "Warnings and errors only": logging.WARNING,
+    "Summary": logging.INFO,
+    "Debug": logging.DEBUG,
+}
+DEFAULT_LOG_LEVEL = "Summary"
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting the message to the listener's thread.
+    The default one formats every record before queueing it, on the thread that logged it.
+    """
+    def prepare(self, record):
+        return record
+
+def start_file_logging(filename: str, level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """Sends all log records through a queue to `filename`, which is written on a background thread.
+    Records below `level` are dropped before their message is ever formatted.
+    """
+    # Remove all handlers associated with the root logger object.
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    file_handler = logging.FileHandler(filename, mode='w', encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    logging.root.addHandler(DeferredQueueHandler(log_queue))
+    logging.root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+def stop_file_logging(listener: logging.handlers.QueueListener):
+    """Writes out everything still queued, then closes the log file."""
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    for handler in logging.root.handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logging.root.removeHandler(handler)
@@ -0,0 +1,164 @@
+from math import floor, sqrt, hypot
+
+from .placement import rotate_point
+
+def key_centre(key):
+    """Centre of a key in KLE units, after rotating it with its cluster."""
+    return rotate_point(key.x + key.width/2, key.y + key.height/2, key.rotation_x, key.rotation_y, key.rotation_angle)
+
+def quartiles(values) -> tuple:
+    """Lower quartile, median and upper quartile of some numbers (interpolated between the two nearest values)."""
+    ordered = sorted(values)
+    def at(fraction):
+        pos = fraction * (len(ordered) - 1)
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+    return at(0.25), at(0.5), at(0.75)
+
+# Points further than this many times the upper quartile of the distances from the median are left out of normalizing
+OUTLIER_DISTANCE = 3
+
+def normalize_points(points: list) -> list:
+    """Moves points so their centroid is at the origin and scales them (the same on both axes, so the shape is kept)
+    to a root mean square distance of 1 from it, so point sets in different units and scales (KLE units, board
+    nanometres, a schematic grid...) can be compared. The centroid and spread of many points hardly move if some of
+    them do. Points far from the rest (e.g. a switch parked off the board, see `OUTLIER_DISTANCE`) would drag both,
+    so they are left out of the centroid and spread, found by their distance from the median.
+    """
+    if not points:
+        return []
+    _, mx, _ = quartiles(x for x, _ in points)
+    _, my, _ = quartiles(y for _, y in points)
+    distances = [hypot(x - mx, y - my) for x, y in points]
+    limit = OUTLIER_DISTANCE * quartiles(distances)[2]
+    inliers = [point for point, distance in zip(points, distances) if distance <= limit] or points
+
+    cx = sum(x for x, _ in inliers) / len(inliers)
+    cy = sum(y for _, y in inliers) / len(inliers)
+    spread = sqrt(sum((x - cx) ** 2 + (y - cy) ** 2 for x, y in inliers) / len(inliers)) or 1.0
+    return [((x - cx) / spread, (y - cy) / spread) for x, y in points]
+
+# Most points a cell of a `SpatialGrid` should hold, cells are made smaller (up to `MAX_REFINEMENTS` times) until they do
+CELL_CAPACITY = 8
+MAX_REFINEMENTS = 8
+
+def cell_size(points: list) -> float:
+    """Size of square cells that hold about one point each where most of the points are: the area of the box between the
+    quartiles of both axes divided by the number of points in it. Points far from the rest don't change it.
+    """
+    x_low, _, x_high = quartiles(x for x, _ in points)
+    y_low, _, y_high = quartiles(y for _, y in points)
+    inside = sum(1 for x, y in points if x_low <= x <= x_high and y_low <= y <= y_high) or 1
+    width = x_high - x_low
+    height = y_high - y_low
+    if width and height:
+        return sqrt(width * height / inside)
+    # All (or most) points on one line
+    return max(width, height) / inside or 1.0
+
+class SpatialGrid():
+    """Grid of square cells over some points, answering nearest neighbour queries by searching rings of cells outwards
+    from the query point instead of comparing against every point. Points can be removed once they are used.
+    Cells are sized by where most points are (see `cell_size`) and only cells with points are kept, so points far from
+    the rest don't make the cells coarser, and cells with many points are split until they have at most `CELL_CAPACITY`.
+    """
+    def __init__(self, points: list):
+        self.points = points
+        self.remaining = len(points)
+        self.cell_size = cell_size(points) if points else 1.0
+        self.cells = self.fill()
+        for _ in range(MAX_REFINEMENTS):
+            if max((len(cell) for cell in self.cells.values()), default=0) <= CELL_CAPACITY:
+                break
+            self.cell_size /= 2
+            self.cells = self.fill()
+
+    def fill(self) -> dict:
+        cells = {}
+        for ndx, (x, y) in enumerate(self.points):
+            cells.setdefault(self.cell(x, y), set()).add(ndx)
+        return cells
+
+    def cell(self, x: float, y: float):
+        return floor(x / self.cell_size), floor(y / self.cell_size)
+
+    def remove(self, ndx: int):
+        cell = self.cell(*self.points[ndx])
+        indices = self.cells.get(cell)
+        if indices is not None and ndx in indices:
+            indices.remove(ndx)
+            self.remaining -= 1
+            if not indices:
+                del self.cells[cell]
+
+    def ring(self, cx: int, cy: int, radius: int):
+        """Cells at exactly `radius` cells from (cx, cy), measured as the larger of both axes."""
+        if radius == 0:
+            yield cx, cy
+            return
+        for dx in range(-radius, radius + 1):
+            for dy in (-radius, radius) if abs(dx) != radius else range(-radius, radius + 1):
+                yield cx + dx, cy + dy
+
+    def nearest(self, x: float, y: float, k: int = 1) -> list:
+        """Up to `k` `(distance, index)` pairs of the remaining points closest to (x, y), closest first."""
+        k = min(k, self.remaining)
+        if k <= 0:
+            return []
+
+        cx, cy = self.cell(x, y)
+        found = []
+        radius = 0
+        while True:
+            if 8 * radius > len(self.cells):
+                # The ring has more cells than there are cells with points left (the points left are far away), look at those instead
+                for (column, row), indices in self.cells.items():
+                    if max(abs(column - cx), abs(row - cy)) >= radius:
+                        found.extend((hypot(self.points[ndx][0] - x, self.points[ndx][1] - y), ndx) for ndx in indices)
+                break
+
+            for cell in self.ring(cx, cy, radius):
+                for ndx in self.cells.get(cell, ()):
+                    px, py = self.points[ndx]
+                    found.append((hypot(px - x, py - y), ndx))
+
+            # Points in the rings further out are at least `radius` cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= radius * self.cell_size:
+                    break
+            radius += 1
+        found.sort()
+        return found[:k]
+
+def match_points(sources: list, targets: list, candidates: int = 8) -> list:
+    """Assigns every source point to a different target point, closest pairs first.
+
+    Each source's `candidates` nearest targets (found with a `SpatialGrid`) are collected and all pairs are taken in order
+    of distance if neither end is assigned yet. Sources left over (all their candidates went to closer sources) then get
+    the nearest free target. Returns the index of the target assigned to each source, None once targets run out.
+    """
+    grid = SpatialGrid(targets)
+    pairs = []
+    for source, (x, y) in enumerate(sources):
+        pairs.extend((distance, source, target) for distance, target in grid.nearest(x, y, candidates))
+    pairs.sort()
+
+    assignment = [None] * len(sources)
+    taken = set()
+    for _, source, target in pairs:
+        if assignment[source] is None and target not in taken:
+            assignment[source] = target
+            taken.add(target)
+            grid.remove(target)
+
+    for source, (x, y) in enumerate(sources):
+        if assignment[source] is None:
+            nearest = grid.nearest(x, y)
+            if not nearest:
+                break
+            assignment[source] = nearest[0][1]
+            grid.remove(nearest[0][1])
+
+    return assignment
@@ -0,0 +1,58 @@
+from .matching import match_points
+
+class Pairing():
+    """The diode, stabilizer and companion footprints that belong to every switch (by reference), for boards whose references
+    don't line up (`D12` isn't necessarily the diode of `SW12`). Switches without a diode, stabilizer or companion are left out.
+    """
+    def __init__(self, diodes: dict = None, stabilizers: dict = None, companions: dict = None):
+        self.diodes = diodes or {} # switch reference -> diode reference
+        self.stabilizers = stabilizers or {} # switch reference -> stabilizer reference
+        self.companions = companions or {} # companion reference format -> switch reference -> companion reference
+
+    def rows(self) -> list:
+        """One `(switch, diode, stabilizer)` row per switch with a diode or stabilizer, None for the ones it doesn't have."""
+        switches = list(dict.fromkeys(list(self.diodes) + list(self.stabilizers)))
+        return [(switch, self.diodes.get(switch), self.stabilizers.get(switch)) for switch in switches]
+
+def pair_by_nets(switch_nets: dict, companion_nets: dict) -> dict:
+    """Pairs companions (e.g. diodes) with the switch they share a net with, returning switch -> companion.
+    Only nets that connect exactly one switch and one companion count: in a key matrix that is the net between
+    a switch and its diode, while row and column nets connect many of them.
+    """
+    switches_on = {}
+    companions_on = {}
+    for switch, nets in switch_nets.items():
+        for net in nets:
+            switches_on.setdefault(net, []).append(switch)
+    for companion, nets in companion_nets.items():
+        for net in nets:
+            companions_on.setdefault(net, []).append(companion)
+
+    pairs = {}
+    paired = set()
+    for net, companions in companions_on.items():
+        switches = switches_on.get(net, ())
+        if len(companions) == 1 and len(switches) == 1 and switches[0] not in pairs and companions[0] not in paired:
+            pairs[switches[0]] = companions[0]
+            paired.add(companions[0])
+    return pairs
+
+def pair_by_position(switch_positions: dict, companion_positions: dict) -> dict:
+    """Pairs every companion with the nearest switch that doesn't have one yet, closest pairs first (see `matching.match_points`),
+    returning switch -> companion. Positions are `(x, y)` in the same units for both.
+    """
+    switches = list(switch_positions)
+    companions = list(companion_positions)
+    assignment = match_points([companion_positions[companion] for companion in companions], [switch_positions[switch] for switch in switches])
+    return {switches[target]: companion for companion, target in zip(companions, assignment) if target is not None}
+
+def pair_companions(switches: dict, companions: dict) -> dict:
+    """Pairs companion footprints with switches, both given as reference -> `((x, y), nets)`, returning switch -> companion.
+    Companions are paired by shared net first (see `pair_by_nets`), the rest by position among the switches left.
+    """
+    pairs = pair_by_nets({switch: nets for switch, (_, nets) in switches.items()},
+                         {companion: nets for companion, (_, nets) in companions.items()})
+    paired = set(pairs.values())
+    pairs.update(pair_by_position({switch: position for switch, (position, _) in switches.items() if switch not in pairs},
+                                  {companion: position for companion, (position, _) in companions.items() if companion not in paired}))
+    return pairs
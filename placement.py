@@ -0,0 +1,351 @@
+import os
+import csv
+import json
+from collections import namedtuple
+from math import sin, cos, radians
+
+try:
+    import numpy as np
+except ImportError: # numpy isn't bundled with every KiCad install
+    np = None
+
+# Final placement of a footprint: position in nm and orientation in degrees (KiCad convention)
+Pose = namedtuple("Pose", ["x", "y", "orientation"])
+
+def normalize_angle(angle: float) -> float:
+    """Normalizes an angle in degrees to (-180, 180], the same range KiCad stores footprint orientations in."""
+    while angle <= -180:
+        angle += 360
+    while angle > 180:
+        angle -= 360
+    return angle
+
+def rotate_point(x: float, y: float, cx: float, cy: float, angle: float):
+    """Rotates the point (x, y) around (cx, cy) by `angle` degrees clockwise (KLE convention, y axis pointing down).
+    Equivalent to KiCad's `RotatePoint` with an angle of `-angle`.
+    """
+    if not angle:
+        return x, y
+    s = sin(radians(angle))
+    c = cos(radians(angle))
+    dx = x - cx
+    dy = y - cy
+    return cx + dx * c - dy * s, cy + dx * s + dy * c
+
+class ClusterTransform():
+    """Rotation of a KLE rotated cluster on the board: `angle` degrees clockwise (KLE convention) around `centre` (nm).
+    Every footprint of every key of a cluster (same rotation angle and origin) shares one, see `cluster_transforms`.
+    """
+    def __init__(self, centre, angle: float):
+        self.centre = centre
+        self.angle = angle
+        self.sin = sin(radians(angle))
+        self.cos = cos(radians(angle))
+
+    def apply(self, x: float, y: float):
+        """Rotates the point (x, y) with the cluster, same as `rotate_point`."""
+        if not self.angle:
+            return x, y
+        dx = x - self.centre[0]
+        dy = y - self.centre[1]
+        return self.centre[0] + dx * self.cos - dy * self.sin, self.centre[1] + dx * self.sin + dy * self.cos
+
+    def invert(self, x: float, y: float):
+        """Where the point (x, y) was before `apply` rotated it with the cluster."""
+        if not self.angle:
+            return x, y
+        dx = x - self.centre[0]
+        dy = y - self.centre[1]
+        return self.centre[0] + dx * self.cos + dy * self.sin, self.centre[1] - dx * self.sin + dy * self.cos
+
+def cluster_transform(cluster, origin, key_distance) -> ClusterTransform:
+    """`ClusterTransform` of a cluster given as `(angle, rotation x, rotation y)` (KLE units), for a layout whose top left corner is at `origin` (nm)."""
+    angle, rotation_x, rotation_y = cluster
+    return ClusterTransform((int(key_distance * rotation_x) + origin[0], int(key_distance * rotation_y) + origin[1]), angle)
+
+def cluster_transforms(keys, origin, key_distance):
+    """Computes the `ClusterTransform` of every cluster of keys once (see `cluster_transform`).
+    Returns the transforms and the index of the transform of every key, in the same order as the keys.
+    """
+    clusters = {} # (angle, rotation x, rotation y) -> index in the transforms
+    key_clusters = [clusters.setdefault((key.rotation_angle, key.rotation_x, key.rotation_y), len(clusters)) for key in keys]
+    return [cluster_transform(cluster, origin, key_distance) for cluster in clusters], key_clusters
+
+def key_position(key, origin, key_distance):
+    """Board position (nm) of the centre of `key` before it is rotated with its cluster, for a layout whose top left corner
+    is at `origin` (nm), truncated to whole nm the same way `plan_key_poses` does.
+    """
+    u = key_distance
+    return int(u * key.x + (u * key.width) // 2) + origin[0], int(u * key.y + (u * key.height) // 2) + origin[1]
+
+def layout_origin(key, position, key_distance, rotated: bool = True):
+    """Board position (nm) of the top left corner of the layout, such that `key` ends up centred on `position` (nm):
+    the inverse of what `plan_key_poses` does with a key. If not `rotated`, `position` is where the key is before it is
+    rotated with its cluster (it isn't rotated on the board yet). Rounded to whole nm, so the key is planned right back onto `position`.
+    """
+    # The cluster's centre moves with the top left corner of the layout
+    centre = key_position(key, (0, 0), key_distance)
+    if rotated:
+        centre = cluster_transform((key.rotation_angle, key.rotation_x, key.rotation_y), (0, 0), key_distance).apply(*centre)
+    return int(round(position[0] - centre[0])), int(round(position[1] - centre[1]))
+
+def layout_offset(key, position, origin, key_distance):
+    """Offset (nm) from the centre of `key` before it is rotated with its cluster, of a footprint that is at `position` (nm)
+    on the board once rotated, for a layout whose top left corner is at `origin` (see `layout_origin`). It isn't rounded:
+    `plan_key_poses` rounds the rotated pose, which puts the footprint right back onto `position`.
+    """
+    x, y = cluster_transform((key.rotation_angle, key.rotation_x, key.rotation_y), origin, key_distance).invert(*position)
+    cx, cy = key_position(key, origin, key_distance)
+    return x - cx, y - cy
+
+def compose_pose(x: float, y: float, orientation: float, extra_pivot=None, extra_rotation: float = 0, cluster: ClusterTransform = None) -> Pose:
+    """Composes the transforms the placer used to apply one by one with `FOOTPRINT.Rotate` into a single pose:
+
+    1. the footprint is placed at (x, y) with the given orientation
+    2. it is rotated by `extra_rotation` around `extra_pivot` (label 10, extra switch rotation)
+    3. it is rotated with its key's `cluster` (KLE rotated cluster)
+
+    Rotations are clockwise in degrees (KLE convention).
+    """
+    if extra_rotation and extra_pivot is not None:
+        x, y = rotate_point(x, y, extra_pivot[0], extra_pivot[1], extra_rotation)
+        orientation -= extra_rotation
+
+    if cluster is not None and cluster.angle:
+        x, y = cluster.apply(x, y)
+        orientation -= cluster.angle
+
+    return Pose(int(round(x)), int(round(y)), normalize_angle(orientation))
+
+def normalize_angles(angles):
+    """Vectorized `normalize_angle`, works on both numbers and numpy arrays."""
+    return 180 - ((180 - angles) % 360)
+
+def extra_switch_rotation(key) -> int:
+    # Extra individual switch rotations i.e. extra rotation compared to the first switch's rotation e.g. for south/north facing switches
+    return int(key.labels[10]) if key.labels[10].isdigit() else 0
+
+def is_stabilizer_flipped(key) -> bool:
+    # Whether or not to flip the stablizer footprint
+    return key.labels[9].lower() == 'f'
+
+class KeyPoses():
+    """Target poses of the switch, diode, stabilizer and companions of every key, in the same order as the keys.
+    Each pose attribute is a list (or numpy array) of x, y and orientation values, `companions` has one per companion.
+    """
+    def __init__(self, switch, diode, stabilizer, companions=()):
+        self.switch = switch
+        self.diode = diode
+        self.stabilizer = stabilizer
+        self.companions = list(companions)
+
+    def __len__(self):
+        return len(self.switch[0])
+
+    def pose(self, kind: str, ndx: int) -> Pose:
+        x, y, orientation = getattr(self, kind)
+        return Pose(int(x[ndx]), int(y[ndx]), float(orientation[ndx]))
+
+    def companion_pose(self, companion: int, ndx: int) -> Pose:
+        x, y, orientation = self.companions[companion]
+        return Pose(int(x[ndx]), int(y[ndx]), float(orientation[ndx]))
+
+class PlacementPlan():
+    """Ordered mapping of footprint reference -> target `Pose` for a single run."""
+    def __init__(self):
+        self.poses = {}
+        self.kinds = {}
+
+    def add(self, reference: str, pose: Pose, kind: str):
+        self.poses[reference] = pose
+        self.kinds[reference] = kind
+
+    def __len__(self):
+        return len(self.poses)
+
+    def __contains__(self, reference):
+        return reference in self.poses
+
+    def __getitem__(self, reference) -> Pose:
+        return self.poses[reference]
+
+    def items(self):
+        return self.poses.items()
+
+    def changed(self, previous) -> list:
+        """References whose target pose differs from the `previous` plan (all of them if there is none)."""
+        if previous is None:
+            return list(self.poses)
+        return [reference for reference, pose in self.poses.items() if previous.poses.get(reference) != pose]
+
+# Plans are saved (see `KeyPlacer.save_plan_file`) as json, which `KeyPlacer.apply_plan_file` reapplies without the KLE,
+# or exported as csv, which can't be reapplied
+PLAN_FILE_FORMAT = "kle-placer-plan"
+PLAN_VERSION = 2
+PLAN_FILE_EXTENSION = ".plan.json"
+PLAN_FORMATS = ("json", "csv")
+PLAN_FIELDS = ["reference", "kind", "x", "y", "orientation", "side"]
+SIDES = ("front", "back")
+
+def plan_rows(plan: PlacementPlan, sides: dict = None) -> list:
+    """One dict per footprint of the plan, with the position in mm (like KiCad shows it), the orientation in degrees
+    and the side of the board ("front" or "back", None if unknown) from `sides`.
+    """
+    sides = sides or {}
+    return [{"reference": reference, "kind": plan.kinds[reference], "x": pose.x / 1000000.0, "y": pose.y / 1000000.0,
+             "orientation": pose.orientation, "side": sides.get(reference)} for reference, pose in plan.items()]
+
+def write_plan(plan: PlacementPlan, path: str, format: str = None, sides: dict = None):
+    """Writes a plan as json or csv (`format`, by default from the extension of `path`).
+    `sides` maps references to the side of the board their footprint should be on, if known.
+    """
+    format = format or os.path.splitext(path)[1].lstrip(".").lower()
+    if format not in PLAN_FORMATS:
+        raise Exception("Unknown plan format {}, expected one of {}".format(format, ", ".join(PLAN_FORMATS)))
+
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if format == "json":
+            json.dump({"format": PLAN_FILE_FORMAT, "version": PLAN_VERSION, "units": "mm", "footprints": plan_rows(plan, sides)}, file, indent=1)
+        else:
+            writer = csv.DictWriter(file, PLAN_FIELDS)
+            writer.writeheader()
+            writer.writerows(plan_rows(plan, sides))
+
+def load_plan(path: str):
+    """Loads a plan written as json with `write_plan`, returning the plan and the sides of its footprints."""
+    with open(path, "r", encoding="utf-8") as file:
+        try:
+            data = json.load(file)
+        except ValueError as e:
+            raise Exception("{} is not a placement plan: {}".format(path, e))
+
+    if not isinstance(data, dict) or data.get("format") != PLAN_FILE_FORMAT:
+        raise Exception("{} is not a placement plan".format(path))
+    if data.get("version") != PLAN_VERSION:
+        raise Exception("Placement plan {} has version {}, only version {} is supported".format(path, data.get("version"), PLAN_VERSION))
+
+    plan = PlacementPlan()
+    sides = {}
+    for row in data["footprints"]:
+        reference = row["reference"]
+        # Positions are saved in mm, rounding back to whole nm gives the planned position exactly
+        plan.add(reference, Pose(int(round(row["x"] * 1000000)), int(round(row["y"] * 1000000)), float(row["orientation"])), row["kind"])
+        if row.get("side") in SIDES:
+            sides[reference] = row["side"]
+    return plan, sides
+
+def plan_key_poses(keys, origin, key_distance, switch_rotation, diode_rotation, diode_offset, companions=()) -> KeyPoses:
+    """Computes the target pose of every switch, diode, stabilizer and companion in one batch.
+
+    `origin` is the board position (nm) of the top left corner of the layout, `key_distance` the size of 1u in nm,
+    `switch_rotation`/`diode_rotation` the orientation of the first switch/diode and `diode_offset` the (x, y) offset
+    in nm of every diode from its switch. `companions` are `(rotation, offset)` pairs of other footprints placed
+    like diodes (e.g. LEDs), one per kind of companion. Uses numpy if it is available.
+    """
+    if np is None or not keys:
+        return _plan_key_poses_python(keys, origin, key_distance, switch_rotation, diode_rotation, diode_offset, companions)
+
+    u = key_distance
+    x = np.fromiter((k.x for k in keys), float, len(keys))
+    y = np.fromiter((k.y for k in keys), float, len(keys))
+    width = np.fromiter((k.width for k in keys), float, len(keys))
+    height = np.fromiter((k.height for k in keys), float, len(keys))
+    extra = np.fromiter((extra_switch_rotation(k) for k in keys), float, len(keys))
+    flip = np.fromiter((is_stabilizer_flipped(k) for k in keys), bool, len(keys))
+
+    # Centre of every key on the board
+    px = np.trunc(u * x + (u * width) // 2) + origin[0]
+    py = np.trunc(u * y + (u * height) // 2) + origin[1]
+
+    # Transform of every key's cluster, computed once per cluster
+    transforms, key_clusters = cluster_transforms(keys, origin, u)
+    key_clusters = np.array(key_clusters, dtype=int)
+    def per_key(values):
+        return np.array(values, dtype=float)[key_clusters]
+    cx = per_key([transform.centre[0] for transform in transforms])
+    cy = per_key([transform.centre[1] for transform in transforms])
+    angle = per_key([transform.angle for transform in transforms])
+    cluster_sin = per_key([transform.sin for transform in transforms])
+    cluster_cos = per_key([transform.cos for transform in transforms])
+
+    def rotate_around_cluster(ax, ay):
+        dx = ax - cx
+        dy = ay - cy
+        return np.rint(cx + dx * cluster_cos - dy * cluster_sin), np.rint(cy + dx * cluster_sin + dy * cluster_cos)
+
+    # Switches only rotate around their own centre for the extra rotation, so only the orientation changes
+    switch = rotate_around_cluster(px, py) + (normalize_angles(switch_rotation - extra - angle),)
+
+    # Diodes (and companions) are offset from the switch centre, rotated with the extra switch rotation
+    extra_sin = np.sin(np.radians(extra))
+    extra_cos = np.cos(np.radians(extra))
+
+    def offset_from_switch(offset, rotation):
+        dx = px + offset[0] * extra_cos - offset[1] * extra_sin
+        dy = py + offset[0] * extra_sin + offset[1] * extra_cos
+        return rotate_around_cluster(dx, dy) + (normalize_angles(rotation - extra - angle),)
+
+    diode = offset_from_switch(diode_offset, diode_rotation)
+    stabilizer = switch[:2] + (normalize_angles(np.where(flip, 180., 0.) - angle),)
+
+    return KeyPoses(switch, diode, stabilizer, [offset_from_switch(offset, rotation) for rotation, offset in companions])
+
+def _plan_key_poses_python(keys, origin, key_distance, switch_rotation, diode_rotation, diode_offset, companions=()) -> KeyPoses:
+    u = key_distance
+    switch = ([], [], [])
+    diode = ([], [], [])
+    stabilizer = ([], [], [])
+    companion_poses = [([], [], []) for _ in companions]
+
+    def append(poses, pose):
+        for values, value in zip(poses, pose):
+            values.append(value)
+
+    transforms, key_clusters = cluster_transforms(keys, origin, u)
+    for key, cluster in zip(keys, key_clusters):
+        cluster = transforms[cluster]
+        extra = extra_switch_rotation(key)
+        px = int(u * key.x + (u * key.width) // 2) + origin[0]
+        py = int(u * key.y + (u * key.height) // 2) + origin[1]
+
+        append(switch, compose_pose(px, py, switch_rotation, (px, py), extra, cluster))
+        append(diode, compose_pose(px + diode_offset[0], py + diode_offset[1], diode_rotation, (px, py), extra, cluster))
+        append(stabilizer, compose_pose(px, py, 180 if is_stabilizer_flipped(key) else 0, cluster=cluster))
+        for poses, (rotation, offset) in zip(companion_poses, companions):
+            append(poses, compose_pose(px + offset[0], py + offset[1], rotation, (px, py), extra, cluster))
+
+    return KeyPoses(switch, diode, stabilizer, companion_poses)
+
+def build_plan(key_poses: KeyPoses, key_numbers, key_format, stabilizer_format, diode_format, move_diodes, has_footprint, pairing=None,
+               companion_formats=()) -> PlacementPlan:
+    """Turns the poses of every key into a plan for the footprints that exist (`has_footprint(reference)`).
+    Key `n` (e.g. from label 4) maps to the references `key_format.format(n)` etc, or with a `pairing.Pairing`,
+    to the switch `key_format.format(n)` and the diode, stabilizer and companions paired with it.
+    `companion_formats` are the reference formats of the companions of `key_poses`, in the same order.
+    """
+    plan = PlacementPlan()
+    for ndx, number in enumerate(key_numbers):
+        switch_reference = key_format.format(number)
+        plan.add(switch_reference, key_poses.pose("switch", ndx), "switch")
+
+        if pairing is not None:
+            diode_reference = pairing.diodes.get(switch_reference)
+            stabilizer_reference = pairing.stabilizers.get(switch_reference)
+        else:
+            diode_reference = diode_format.format(number)
+            stabilizer_reference = stabilizer_format.format(number)
+
+        if move_diodes and diode_reference is not None and has_footprint(diode_reference):
+            plan.add(diode_reference, key_poses.pose("diode", ndx), "diode")
+
+        if stabilizer_reference is not None and has_footprint(stabilizer_reference):
+            plan.add(stabilizer_reference, key_poses.pose("stabilizer", ndx), "stabilizer")
+
+        for companion, companion_format in enumerate(companion_formats):
+            if pairing is not None:
+                companion_reference = pairing.companions.get(companion_format, {}).get(switch_reference)
+            else:
+                companion_reference = companion_format.format(number)
+            if companion_reference is not None and has_footprint(companion_reference):
+                plan.add(companion_reference, key_poses.companion_pose(companion, ndx), "companion")
+    return plan
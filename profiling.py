@@ -0,0 +1,58 @@
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+REPORT_VERSION = 1
+
+class RunStats():
+    """Wall-clock time spent in each phase of a placement run, plus counters of the work done (keys, footprints moved, lookups...).
+    Phases and counters keep the order they were first recorded in, which is the order they ran in.
+    """
+    def __init__(self):
+        self.phases = {} # phase name -> seconds
+        self.counters = {} # counter name -> count
+        self.start = time.perf_counter()
+        self.total = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the body of a `with` block, adding to the phase's time if it runs more than once."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def to_dict(self) -> dict:
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        return {
+            "version": REPORT_VERSION,
+            "total_seconds": round(total, 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+    def write(self, path: str, **info):
+        """Writes the report as json, with any extra `info` (e.g. which board and layout were placed) at the top level."""
+        data = self.to_dict()
+        data.update(info)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2)
+
+def profile_call(path: str, func, *args, **kwargs):
+    """Calls `func` under cProfile and saves the profile to `path` (even if `func` raises), e.g. for `python -m pstats` or snakeviz."""
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        profile.dump_stats(path)
@@ -0,0 +1,142 @@
+import re
+import json
+from json.decoder import scanstring
+
+# One token of KLE raw data (after any whitespace): the JavaScript-style objects the KLE editor shows in its
+# "Raw data" tab, e.g. `[{a:7,w:1.5},"Tab","Q"]`, with unquoted keys and rows without an outer array.
+# Any other character is a token of its own, so every character of the text ends up in a token (or is whitespace)
+TOKEN = re.compile(r"""[ \t\r\n]*(
+    "(?:[^"\\]|\\.)*"                               # string
+  | -?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?      # number
+  | [A-Za-z_$][A-Za-z0-9_$]*                        # true, false, null or an unquoted key
+  | [^ \t\r\n]                                      # punctuation, or an error
+)""", re.VERBOSE | re.DOTALL)
+
+NAMES = {"true": True, "false": False, "null": None}
+NUMBER_START = frozenset("-.0123456789")
+
+def raw_data_error(text: str, index: int, message: str):
+    """Raises for the token at `index`, with its line and column (found again here, only tokens are kept while parsing)."""
+    pos = len(text)
+    for ndx, match in enumerate(TOKEN.finditer(text)):
+        if ndx == index:
+            pos = match.start(1)
+            break
+    line = text.count("\n", 0, pos) + 1
+    column = pos - (text.rfind("\n", 0, pos) + 1) + 1
+    raise ValueError("Invalid KLE raw data at line {} column {}: {}".format(line, column, message))
+
+def parse_raw_data(text: str) -> list:
+    """Parses KLE raw data into the rows `serial.deserialize` takes (the same as `json.loads` of the json download).
+
+    The text is split into tokens by a single regular expression and the lists and dicts are built while going over
+    them once, without converting the text to json first. Object keys may be quoted or not, commas between rows are
+    optional and trailing commas are allowed. The json download (an outer array around the rows) is parsed too.
+    """
+    tokens = TOKEN.findall(text)
+    top = [] # values outside of any brackets, the rows
+    stack = [] # lists and dicts being read, innermost last
+    keys = [] # key being read of every dict on the stack (None for lists)
+    container = top # innermost list or dict being read
+    in_dict = False
+    expect_value = True # a value (or, in a dict, a key) may come next, otherwise a ',' or closing bracket
+    key_pending = False # a dict key was read, waiting for its ':'
+
+    for index, token in enumerate(tokens):
+        first = token[0]
+
+        if first == "[" or first == "{":
+            if key_pending or (in_dict and keys[-1] is None):
+                raw_data_error(text, index, "unexpected '{}'".format(token))
+            if not expect_value:
+                raw_data_error(text, index, "missing ',' before '{}'".format(token))
+            value = [] if first == "[" else {}
+            if in_dict:
+                container[keys[-1]] = value
+                keys[-1] = None
+            else:
+                container.append(value)
+            stack.append(value)
+            keys.append(None)
+            container = value
+            in_dict = first == "{"
+            expect_value = True
+            continue
+
+        if first == "]" or first == "}":
+            if not stack or (first == "}") != in_dict or key_pending or (in_dict and keys[-1] is not None):
+                raw_data_error(text, index, "unexpected '{}'".format(token))
+            stack.pop()
+            keys.pop()
+            container = stack[-1] if stack else top
+            in_dict = container.__class__ is dict
+            expect_value = not stack # commas between rows are optional
+            continue
+
+        if first == ",":
+            if expect_value and stack:
+                raw_data_error(text, index, "unexpected ','")
+            expect_value = True
+            continue
+
+        if first == ":":
+            if not key_pending:
+                raw_data_error(text, index, "unexpected ':'")
+            key_pending = False
+            continue
+
+        if in_dict and keys[-1] is None:
+            # Object key, quoted or not
+            if not expect_value:
+                raw_data_error(text, index, "missing ',' before {}".format(token))
+            if first == '"' and len(token) > 1:
+                token = token[1:-1] if "\\" not in token else scanstring(token, 1)[0]
+            elif not (first.isascii() and first.isalpha() or first == "_" or first == "$"):
+                raw_data_error(text, index, "unexpected {}".format(token))
+            keys[-1] = token
+            key_pending = True
+            continue
+
+        if key_pending:
+            raw_data_error(text, index, "unexpected {}".format(token))
+        if not expect_value:
+            raw_data_error(text, index, "missing ',' before {}".format(token))
+        if first == '"' and len(token) > 1:
+            value = token[1:-1] if "\\" not in token else scanstring(token, 1)[0]
+        elif first in NUMBER_START and token != "-" and token != ".":
+            value = float(token) if "." in token or "e" in token or "E" in token else int(token)
+        elif token in NAMES:
+            value = NAMES[token]
+        else:
+            raw_data_error(text, index, "unexpected {}".format(token))
+
+        if in_dict:
+            container[keys[-1]] = value
+            keys[-1] = None
+        else:
+            container.append(value)
+        expect_value = not stack
+
+    if stack:
+        raw_data_error(text, len(tokens), "missing '{}'".format("}" if in_dict else "]"))
+    return rows_of(top)
+
+def rows_of(values: list) -> list:
+    # The json download is a single array of rows (lists), the first of which may be the metadata (a dict). Raw data is
+    # the rows themselves, so a single row of only key properties (e.g. `[{x:1}]`) is a row and not the metadata
+    if len(values) != 1 or values[0].__class__ is not list:
+        return values
+    rows = values[0]
+    if rows and rows[0].__class__ is dict:
+        rows = rows[1:]
+    if rows and all(row.__class__ is list for row in rows):
+        return values[0]
+    return values
+
+def layout_rows(text: str) -> list:
+    """Rows of a KLE in either format: the json download is parsed by `json.loads`, anything else as raw data (see `parse_raw_data`)."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return parse_raw_data(text)
+    return rows_of([data])
@@ -1,5 +1,5 @@
 import json
-from copy import deepcopy
+from copy import copy, deepcopy
 
 from dataclasses import dataclass, field as dcf
 from typing import Optional, List, Callable
@@ -89,23 +89,12 @@ def set_ndx(lst: list, ndx: int, obj: object, filler=None) -> list:
     filling the empty spaces with `filler` (`None` by default) if the length of 
     the list is smaller than `ndx`. Used to replicate JavaScript behaviour.
     """
-    try:
+    if ndx >= len(lst):
+        lst.extend([filler] * (ndx - len(lst)))
+        lst.append(obj)
+    else:
         lst[ndx] = obj
-        return lst
-    except IndexError:
-        dct = {}
-        dct[ndx] = obj
-        for i in range(0, max(ndx+1, len(lst))):
-            if i == ndx:
-                continue
-            try:
-                dct[i] = lst[i]
-            except IndexError:
-                dct[i] = filler
-        while len(lst) < len(dct.keys()):
-            lst.append(filler)
-        for i, key in enumerate(dct.keys()):
-            lst[i] = (dct[i])
+    return lst
 
 def is_empty_object(o):
     for prop in o:
@@ -313,10 +302,19 @@ def reorder_labels_in(labels, align, filler=None, skipdefault=False):
         set_ndx(ret, lm, lbl)
     return ret
 
+def copy_key(key: Key) -> Key:
+    """Copies a key, only duplicating the parts that `deserialize` mutates afterwards (`default` and `text_color`).
+    Much cheaper than a `deepcopy` per key, `labels` and `text_size` are replaced by new lists anyway.
+    """
+    new_key = copy(key)
+    new_key.default = KeyDefault(key.default.text_color, key.default.text_size)
+    new_key.text_color = list(key.text_color)
+    return new_key
+
 def deserialize(rows):
     # Initialize with defaults
-    current = deepcopy(Key())
-    meta = deepcopy(KeyboardMetadata())
+    current = Key()
+    meta = KeyboardMetadata()
     keys = []
     cluster = { "x": 0, "y": 0 }
     align = 4
@@ -325,7 +323,7 @@ def deserialize(rows):
             for k, item in enumerate(rows_r):
                 key = item
                 if isinstance(key, str):
-                    new_key = deepcopy(current)
+                    new_key = copy_key(current)
                     new_key.width2 = new_key.width2 if new_key.width2 != 0 else current.width
                     new_key.height2 = new_key.height2 if new_key.height2 != 0 else current.height
                     new_key.labels = reorder_labels_in(key.split("\n"), align, "")
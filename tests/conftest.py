@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the plugin's modules like the benchmarks do, without KiCad (see benchmarks/common.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
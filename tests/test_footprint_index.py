@@ -0,0 +1,22 @@
+from common import import_module, use_fake_pcbnew
+
+fake_pcbnew = use_fake_pcbnew()
+footprint_index = import_module("footprint_index")
+
+def board(*references):
+    return fake_pcbnew.BOARD([fake_pcbnew.FOOTPRINT(reference) for reference in references])
+
+def test_numbered_by_prefix():
+    index = footprint_index.FootprintIndex(board("SW1", "SW2", "SW10", "S1", "D1", "SW", "SWA1"))
+    assert index.numbered("SW{}") == {1: "SW1", 2: "SW2", 10: "SW10"}
+    assert index.numbered("S{}") == {1: "S1"}
+
+def test_numbered_with_a_suffix():
+    index = footprint_index.FootprintIndex(board("K1_A", "K2_A", "K2_B", "K3"))
+    assert index.numbered("K{}_A") == {1: "K1_A", 2: "K2_A"}
+
+def test_numbered_leaves_out_zero_padded_references():
+    # `SW{}` of 12 is SW12, SW012 would be looked up as a footprint that isn't there
+    index = footprint_index.FootprintIndex(board("SW012", "SW5", "SW007", "K03_A", "K4_A"))
+    assert index.numbered("SW{}") == {5: "SW5"}
+    assert index.numbered("K{}_A") == {4: "K4_A"}
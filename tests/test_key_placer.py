@@ -0,0 +1,81 @@
+import logging
+
+from common import import_module, use_fake_pcbnew
+
+fake_pcbnew = use_fake_pcbnew()
+serial = import_module("serial")
+key_placer = import_module("key_placer")
+
+logger = logging.getLogger("tests")
+
+# Two rows in a cluster rotated by 15 degrees, switches numbered by label 4 (Specific Reference Mode)
+ROTATED_ROWS = [[{"r": 15, "rx": 1, "ry": 1, "a": 7}, "1", "2", "3"], ["4", {"w": 1.5}, "5"]]
+
+def rotated_board(x, y, diode_offset):
+    # SW1 and D1 are already rotated with their cluster, the other footprints are anywhere
+    footprints = [fake_pcbnew.FOOTPRINT("SW1", x, y, -15), fake_pcbnew.FOOTPRINT("D1", x + diode_offset[0], y + diode_offset[1], -15)]
+    for number in range(2, 6):
+        footprints.append(fake_pcbnew.FOOTPRINT("SW{}".format(number), 1000000 * number, 0))
+        footprints.append(fake_pcbnew.FOOTPRINT("D{}".format(number), 1000000 * number, 5000000))
+    return fake_pcbnew.BOARD(footprints, "rotated.kicad_pcb")
+
+def scattered_board(file_name):
+    footprints = []
+    for number in range(1, 6):
+        footprints.append(fake_pcbnew.FOOTPRINT("SW{}".format(number), 3000000 * number, 1000000 * number, 90))
+        footprints.append(fake_pcbnew.FOOTPRINT("D{}".format(number), 3000000 * number, 7000000, 0))
+    return fake_pcbnew.BOARD(footprints, file_name)
+
+def place(board, incremental=False):
+    placer = key_placer.KeyPlacer(logger, board, serial.deserialize(ROTATED_ROWS))
+    plan = placer.Run("SW{}", "S{}", "D{}", True, True, True, incremental)
+    return placer, plan
+
+def poses(board):
+    return {footprint.GetReference(): (footprint.GetPosition().x, footprint.GetPosition().y, footprint.GetOrientationDegrees())
+            for footprint in board.GetFootprints()}
+
+def test_already_rotated_first_key_stays_in_place():
+    for x, y, diode_offset in [(50000000, 50000000, (3100000, 4900000)), (50000001, 49999999, (-2500003, 5000007)), (12345678, 87654321, (1, -1))]:
+        board = rotated_board(x, y, diode_offset)
+        first = poses(board)
+        place(board)
+        placed = poses(board)
+        assert placed["SW1"] == first["SW1"]
+        assert placed["D1"] == first["D1"]
+
+        # Placing again changes nothing, and incremental runs see that every footprint is in place already
+        for incremental in (False, True, True):
+            placer, plan = place(board, incremental)
+            assert poses(board) == placed
+            if incremental:
+                assert placer.moved == 0
+                assert placer.skipped == len(plan)
+
+def test_saved_plan_moves_and_flips_footprints_on_another_board(tmp_path):
+    board = rotated_board(50000001, 49999999, (-2500003, 5000007))
+    board.FindFootprintByReference("D2").Flip(fake_pcbnew.VECTOR2I(0, 0), False)
+    board.FindFootprintByReference("D4").Flip(fake_pcbnew.VECTOR2I(0, 0), False)
+    placer, plan = place(board)
+    path = str(tmp_path / "rotated.plan.json")
+    placer.save_plan_file(plan, path)
+
+    other = scattered_board(str(tmp_path / "other.kicad_pcb"))
+    other.FindFootprintByReference("D4").Flip(fake_pcbnew.VECTOR2I(0, 0), False)
+    other.FindFootprintByReference("SW3").Flip(fake_pcbnew.VECTOR2I(0, 0), False)
+    applied = key_placer.KeyPlacer(logger, other, None).apply_plan_file(path)
+    assert list(applied.items()) == list(plan.items())
+    assert poses(other) == poses(board)
+    assert {footprint.GetReference(): footprint.IsFlipped() for footprint in other.GetFootprints()} == \
+        {footprint.GetReference(): footprint.IsFlipped() for footprint in board.GetFootprints()}
+
+def test_unsaved_boards_are_never_placed_incrementally():
+    # Both boards have no file name yet, the second one must not be compared with the plan of the first
+    first = rotated_board(50000000, 50000000, (3100000, 4900000))
+    first.file_name = ""
+    place(first, True)
+    second = fake_pcbnew.BOARD([fake_pcbnew.FOOTPRINT(reference, x, y, orientation) for reference, (x, y, orientation) in poses(first).items()], "")
+    placer, plan = place(second, True)
+    assert placer.skipped == 0
+    assert placer.moved == len(plan)
+    assert "" not in key_placer.LAST_PLANS
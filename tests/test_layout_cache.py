@@ -0,0 +1,58 @@
+import os
+import json
+import logging
+
+import pytest
+
+from common import import_module
+
+layout_cache = import_module("layout_cache")
+
+logger = logging.getLogger("tests")
+
+ROWS = [["1", {"w": 2}, "2"], ["3"]]
+
+def load(tmp_path, cache):
+    layout = tmp_path / "layout.json"
+    layout.write_text(json.dumps(ROWS))
+    return cache.load(str(layout), False, logger, str(tmp_path / "cache"))
+
+def entry_path(tmp_path):
+    key = layout_cache.LayoutCache().cache_key(json.dumps(ROWS).encode("utf-8"), False)
+    return tmp_path / "cache" / (key + ".json")
+
+def positions(keys):
+    return [(key.x, key.y, key.width, key.labels) for key in keys]
+
+def test_disk_entry_is_read_back(tmp_path):
+    keys = load(tmp_path, layout_cache.LayoutCache())
+    cache = layout_cache.LayoutCache()
+    assert positions(load(tmp_path, cache)) == positions(keys)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+@pytest.mark.parametrize("content", [
+    "[1, 2]",
+    '"keys"',
+    '{"version": 1}',
+    '{"version": 1, "keys": 5}',
+    '{"version": 1, "keys": [[0, 0, 1]]}',
+    '{"version": 1, "keys": [[0, 0, 1, 1, 0, 0, 0, "labels"]]}',
+    '{"version": 1, "keys": [[0, 0, 1, 1, 0, 0, 0, ["", "", ""]]]}',
+    '{"version": 1, "keys": [["0", 0, 1, 1, 0, 0, 0, ["", "", "", "", "", "", "", "", "", "", "", ""]]]}',
+    "{not json",
+])
+def test_malformed_disk_entry_is_a_miss(tmp_path, content):
+    keys = load(tmp_path, layout_cache.LayoutCache())
+    entry_path(tmp_path).write_text(content)
+    cache = layout_cache.LayoutCache()
+    assert positions(load(tmp_path, cache)) == positions(keys)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+def test_read_only_cache_is_still_read(tmp_path, monkeypatch):
+    keys = load(tmp_path, layout_cache.LayoutCache())
+    def utime(path, *args, **kwargs):
+        raise PermissionError(path)
+    monkeypatch.setattr(os, "utime", utime)
+    cache = layout_cache.LayoutCache()
+    assert positions(load(tmp_path, cache)) == positions(keys)
+    assert cache.hits == 1
@@ -0,0 +1,72 @@
+import random
+from math import hypot
+
+from common import import_module
+
+matching = import_module("matching")
+
+def grid_points(columns, rows):
+    return [(float(x), float(y)) for y in range(rows) for x in range(columns)]
+
+def jittered(points, amount=0.3, seed=0):
+    rng = random.Random(seed)
+    return [(x + rng.uniform(-amount, amount), y + rng.uniform(-amount, amount)) for x, y in points]
+
+def test_match_points_pairs_every_source_with_its_nearest_target():
+    sources = grid_points(15, 6)
+    targets = jittered(sources)
+    order = list(range(len(targets)))
+    random.Random(1).shuffle(order)
+    assignment = matching.match_points(sources, [targets[ndx] for ndx in order])
+    assert [order[target] for target in assignment] == list(range(len(sources)))
+
+def test_match_points_takes_closest_pairs_first():
+    # Both sources are nearest to the first target, the closer one gets it
+    assert matching.match_points([(0, 0), (0.4, 0)], [(0.5, 0), (10, 0)]) == [1, 0]
+
+def test_match_points_runs_out_of_targets():
+    assert matching.match_points([(0, 0), (1, 0), (5, 0)], [(4.9, 0), (0.1, 0)]) == [1, None, 0]
+    assert matching.match_points([(0, 0)], []) == [None]
+    assert matching.match_points([], [(0, 0)]) == []
+
+def test_match_points_with_a_target_far_from_the_rest():
+    sources = grid_points(20, 10)
+    targets = jittered(sources)
+    targets[57] = (1e6, 1e6) # e.g. a switch parked off the board
+    assignment = matching.match_points(matching.normalize_points(sources), matching.normalize_points(targets))
+    assert all(target == ndx for ndx, target in enumerate(assignment) if ndx != 57)
+    assert assignment[57] == 57
+
+def test_normalize_points_ignores_units_and_offset():
+    points = jittered(grid_points(12, 5))
+    scaled = [(x * 19050000 + 25000000, y * 19050000 - 3000000) for x, y in points]
+    for (x, y), (sx, sy) in zip(matching.normalize_points(points), matching.normalize_points(scaled)):
+        assert abs(x - sx) < 1e-9 and abs(y - sy) < 1e-9
+
+def test_normalize_points_leaves_out_points_far_from_the_rest():
+    points = grid_points(12, 5)
+    normalized = matching.normalize_points(points)
+    with_outlier = matching.normalize_points(points + [(1e6, -1e6)])
+    assert max(hypot(x - ox, y - oy) for (x, y), (ox, oy) in zip(normalized, with_outlier)) < 0.05
+    assert matching.normalize_points([]) == []
+    assert matching.normalize_points([(3, 4), (3, 4)]) == [(0.0, 0.0), (0.0, 0.0)]
+
+def test_spatial_grid_nearest_matches_brute_force():
+    rng = random.Random(2)
+    points = [(rng.uniform(0, 100), rng.uniform(0, 20)) for _ in range(500)] + [(5000, -5000), (-1e5, 0)]
+    grid = matching.SpatialGrid(points)
+    removed = set(rng.sample(range(len(points)), 200))
+    for ndx in removed:
+        grid.remove(ndx)
+    assert grid.remaining == len(points) - len(removed)
+
+    for x, y in [(rng.uniform(-10, 110), rng.uniform(-10, 30)) for _ in range(100)] + [(4000, -4000), (-2e5, 3)]:
+        expected = sorted((hypot(px - x, py - y), ndx) for ndx, (px, py) in enumerate(points) if ndx not in removed)[:4]
+        assert grid.nearest(x, y, 4) == expected
+
+def test_spatial_grid_splits_crowded_cells():
+    # Most points on top of each other, with a few spread out around them
+    points = [(50 + i * 1e-6, 50.0) for i in range(200)] + [(float(x), 0.0) for x in range(0, 100, 10)]
+    grid = matching.SpatialGrid(points)
+    assert grid.nearest(50, 50, 1) == [(0.0, 0)]
+    assert grid.nearest(0, 0, 1) == [(0.0, 200)]
@@ -0,0 +1,33 @@
+from common import import_module
+
+pairing = import_module("pairing")
+
+def test_pair_by_nets_uses_nets_between_one_switch_and_one_companion():
+    # Row/column nets (1, 2) connect several footprints, the nets between switches and diodes (10, 11) only one of each
+    switches = {"SW1": {1, 10}, "SW2": {1, 11}}
+    diodes = {"D7": {11, 2}, "D3": {10, 2}}
+    assert pairing.pair_by_nets(switches, diodes) == {"SW1": "D3", "SW2": "D7"}
+
+def test_pair_by_nets_leaves_out_shared_and_unconnected_nets():
+    switches = {"SW1": {5}, "SW2": {5}, "SW3": set(), "SW4": {8}}
+    diodes = {"D1": {5}, "D2": set(), "D4": {8}, "D5": {8}}
+    assert pairing.pair_by_nets(switches, diodes) == {}
+
+def test_pair_by_nets_pairs_every_switch_and_companion_once():
+    # Two nets that each connect SW1 and D1 only
+    assert pairing.pair_by_nets({"SW1": {3, 4}}, {"D1": {3, 4}}) == {"SW1": "D1"}
+
+def test_pair_by_position_pairs_nearest_switches():
+    switches = {"SW1": (0, 0), "SW2": (10, 0)}
+    assert pairing.pair_by_position(switches, {"S9": (9, 1), "S4": (1, 1)}) == {"SW1": "S4", "SW2": "S9"}
+    assert pairing.pair_by_position(switches, {}) == {}
+
+def test_pair_companions_falls_back_to_position():
+    switches = {"SW1": ((0, 0), {1, 10}), "SW2": ((10, 0), {1, 11}), "SW3": ((20, 0), {1})}
+    # D1 is connected to SW2 (even though it's closer to SW1), D2 isn't connected and is nearest to SW3 of the switches left
+    diodes = {"D1": ((1, 0), {11}), "D2": ((12, 0), set())}
+    assert pairing.pair_companions(switches, diodes) == {"SW2": "D1", "SW3": "D2"}
+
+def test_pairing_rows():
+    paired = pairing.Pairing({"SW1": "D1", "SW2": "D2"}, {"SW2": "S2", "SW3": "S3"})
+    assert paired.rows() == [("SW1", "D1", None), ("SW2", "D2", "S2"), ("SW3", None, "S3")]
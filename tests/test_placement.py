@@ -0,0 +1,72 @@
+import random
+import logging
+
+import pytest
+
+from common import import_module
+from generators import generate_layout
+
+serial = import_module("serial")
+layout = import_module("layout")
+placement = import_module("placement")
+
+logger = logging.getLogger("tests")
+
+KINDS = ("switch", "diode", "stabilizer")
+
+def prepared_keys(keys: int = 1000) -> list:
+    # Rotated clusters and multilayouts from the generator, plus extra switch rotations (label 10) and flipped stabilizers (label 9)
+    prepared = layout.prepare_keys(serial.deserialize(generate_layout(keys)), True, logger)
+    for ndx, key in enumerate(prepared):
+        labels = list(key.labels)
+        if ndx % 7 == 0:
+            labels[10] = ("90", "180", "15")[ndx % 3]
+        if ndx % 5 == 0:
+            labels[9] = "f"
+        key.labels = tuple(labels)
+    return prepared
+
+def all_poses(key_poses) -> list:
+    return [[key_poses.pose(kind, ndx) for kind in KINDS] + [key_poses.companion_pose(companion, ndx) for companion in range(len(key_poses.companions))]
+            for ndx in range(len(key_poses))]
+
+@pytest.mark.parametrize("origin, switch_rotation, diode_rotation, diode_offset", [
+    ((0, 0), 0, 90, (0, 5000000)),
+    ((25000001, 24999999), 90, -90, (-3100001, 4900003)),
+    ((12345678, 87654321), 180, 0, (1234.5, -2500000.25)), # Offset measured in the unrotated layout (see layout_offset)
+])
+def test_numpy_and_python_plan_the_same_poses(origin, switch_rotation, diode_rotation, diode_offset):
+    if placement.np is None:
+        pytest.skip("numpy isn't installed")
+    keys = prepared_keys()
+    companions = [(180, (-4000000, 0)), (45, (2500000.5, 1000000))]
+    args = (keys, origin, 19050000, switch_rotation, diode_rotation, diode_offset, companions)
+    assert all_poses(placement.plan_key_poses(*args)) == all_poses(placement._plan_key_poses_python(*args))
+
+def test_plan_file_round_trip(tmp_path):
+    plan = placement.PlacementPlan()
+    plan.add("SW1", placement.Pose(25000001, -12345679, -90.0), "switch")
+    plan.add("D1", placement.Pose(999999999, 3, 45.5), "diode")
+    plan.add("S1", placement.Pose(-1, 0, 180.0), "stabilizer")
+    plan.add("LED1", placement.Pose(123456789, 987654321, -0.25), "LED{}")
+    rng = random.Random(0)
+    for number in range(2, 1000):
+        plan.add("SW{}".format(number), placement.Pose(rng.randrange(-2000000000, 2000000000), rng.randrange(-2000000000, 2000000000),
+                                                      rng.choice([0.0, 90.0, -90.0, 180.0, 12.5])), "switch")
+    sides = {"SW1": "front", "D1": "back", "S1": "back"}
+
+    path = str(tmp_path / ("board" + placement.PLAN_FILE_EXTENSION))
+    placement.write_plan(plan, path, sides=sides)
+    loaded, loaded_sides = placement.load_plan(path)
+    assert list(loaded.items()) == list(plan.items())
+    assert loaded.kinds == plan.kinds
+    assert loaded_sides == sides
+
+def test_csv_plans_cant_be_loaded(tmp_path):
+    plan = placement.PlacementPlan()
+    plan.add("SW1", placement.Pose(1, 2, 0.0), "switch")
+    path = str(tmp_path / "board.plan.csv")
+    placement.write_plan(plan, path, sides={"SW1": "back"})
+    assert open(path, encoding="utf-8").read().splitlines() == ["reference,kind,x,y,orientation,side", "SW1,switch,1e-06,2e-06,0.0,back"]
+    with pytest.raises(Exception, match="is not a placement plan"):
+        placement.load_plan(path)
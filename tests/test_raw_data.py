@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from common import import_module
+from generators import generate_layout, raw_data
+
+raw_data_module = import_module("raw_data")
+parse_raw_data, layout_rows = raw_data_module.parse_raw_data, raw_data_module.layout_rows
+
+def test_raw_data_matches_the_json_download():
+    rows = generate_layout(60)
+    assert parse_raw_data(raw_data(rows)) == rows
+    assert layout_rows(raw_data(rows)) == rows
+    assert parse_raw_data(json.dumps(rows)) == rows
+    assert layout_rows(json.dumps(rows, indent=1)) == rows
+
+def test_quoted_and_unquoted_keys():
+    assert parse_raw_data('[{w:1.5,"h":2,$a:1,_b:2},"Tab"]') == [[{"w": 1.5, "h": 2, "$a": 1, "_b": 2}, "Tab"]]
+    assert parse_raw_data('[{"a\\"b":1}]') == [[{'a"b': 1}]]
+
+def test_metadata_before_the_rows():
+    text = '{name:"x", "background": {name:"y",style:"z"}, plate:true}\n["a"]\n["b"]'
+    assert layout_rows(text) == [{"name": "x", "background": {"name": "y", "style": "z"}, "plate": True}, ["a"], ["b"]]
+
+def test_commas_between_rows_are_optional_and_trailing_commas_allowed():
+    assert parse_raw_data('["a"]\n["b"],\n["c"]') == [["a"], ["b"], ["c"]]
+    assert parse_raw_data('[{w:2,},"a",],["b",],') == [[{"w": 2}, "a"], ["b"]]
+
+def test_values_and_escapes():
+    assert parse_raw_data('[{r:-15,rx:.5,ry:1e1,p:null,d:false},"\\u00e9\\n\\"q\\""]') == [[{"r": -15, "rx": 0.5, "ry": 10.0, "p": None, "d": False}, 'é\n"q"']]
+
+def test_empty_text():
+    assert layout_rows("") == []
+    assert layout_rows("  \n") == []
+
+@pytest.mark.parametrize("text, message", [
+    ('["a" "b"]', "missing ','"),
+    ('[{a:1 b:2}]', "missing ','"),
+    ('["a" {w:1}]', "missing ','"),
+    ('[,"a"]', "unexpected ','"),
+    ('[{,a:1}]', "unexpected ','"),
+    ('[{a}]', "unexpected '}'"),
+    ('[{a:}]', "unexpected '}'"),
+    ('[{1:2}]', "unexpected 1"),
+    ('["a"]]', "unexpected ']'"),
+    ('[foo]', "unexpected foo"),
+    ('[@]', "unexpected @"),
+])
+def test_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        layout_rows(text)
+
+def test_unterminated_string():
+    # The string runs to the end of the text, so the '"' is a token of its own
+    with pytest.raises(ValueError, match="line 1 column 2: unexpected \""):
+        layout_rows('["abc]')
+    with pytest.raises(ValueError, match="line 1 column 2"):
+        layout_rows('{"a:1}')
+
+def test_missing_closing_bracket_reports_the_end_of_the_text():
+    with pytest.raises(ValueError, match="line 2 column 5: missing '\\]'"):
+        layout_rows('["a"]\n["b"')
+    with pytest.raises(ValueError, match="missing '}'"):
+        layout_rows('[{a:1')
+
+def test_json_download_is_a_single_array_of_rows():
+    # The json download, with and without metadata
+    assert layout_rows('[{"name":"x"},["a"],["b"]]') == [{"name": "x"}, ["a"], ["b"]]
+    assert layout_rows('[["a"],["b"]]') == [["a"], ["b"]]
+    assert layout_rows('[{name:"x"},["a"]]') == [{"name": "x"}, ["a"]]
+
+def test_single_row_is_not_taken_for_the_json_download():
+    assert layout_rows('["a","b"]') == [["a", "b"]]
+    # A row of only key properties, not the metadata of a layout without keys
+    assert layout_rows('[{x:1}]') == [[{"x": 1}]]
+    assert layout_rows('[{"x":1}]') == [[{"x": 1}]]
+    assert layout_rows('[{x:1},{w:2}]') == [[{"x": 1}, {"w": 2}]]
+    assert layout_rows('[{x:1},"a"]') == [[{"x": 1}, "a"]]
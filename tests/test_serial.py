@@ -0,0 +1,86 @@
+import random
+from copy import deepcopy
+
+import pytest
+
+from common import import_module
+import legacy_serial
+
+serial = import_module("serial")
+
+# Rows using the properties that carry over from key to key (a, f, f2, fa, t, c, r, rx, ry) or only apply to one key (w, h, x, y, ...)
+LAYOUTS = [
+    [{"name": "props", "author": "tests"},
+     [{"a": 7, "f": 4, "t": "#ff0000"}, "Esc", {"x": 1, "f2": 6}, "F1\nA", {"fa": [0, 0, 3]}, "F2\n\n\nB"],
+     [{"y": 0.5, "a": 4, "c": "#333333", "w": 1.5}, "Tab\nX\nY", {"f": 2, "t": "#000000\n\n#00ff00"}, "Q", {"w": 2, "h": 2, "w2": 1.5, "h2": 1, "x2": -0.5}, "Enter"],
+     [{"a": 0, "fa": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]}, "1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n11\n12", {"n": True, "l": True, "g": True}, "F"]],
+    [[{"r": 15, "rx": 1, "ry": 2, "a": 7}, "1", "2"],
+     [{"r": -30, "rx": 5, "ry": 0, "y": -1, "x": 0.5}, "3", {"f": 9}, "4"],
+     [{"rx": 7}, "5", {"t": "#123456"}, "6"],
+     [{"ry": 3, "x": 1}, "7"],
+     [{"r": 0, "rx": 0, "ry": 0, "sm": "alps", "sb": "cherry", "p": "DSA R1"}, "8"]],
+]
+
+def random_layout(rng: random.Random) -> list:
+    rows = []
+    if rng.random() < 0.5:
+        rows.append({"name": "fuzz", "backcolor": "#eeeeee"})
+    for _ in range(rng.randrange(1, 6)):
+        row = []
+        for _ in range(rng.randrange(1, 8)):
+            props = {}
+            if rng.random() < 0.3:
+                props["a"] = rng.randrange(8)
+            if rng.random() < 0.2:
+                props["f"] = rng.randrange(1, 10)
+            if rng.random() < 0.2:
+                props["f2"] = rng.randrange(1, 10)
+            if rng.random() < 0.15:
+                props["fa"] = [rng.randrange(0, 10) for _ in range(rng.randrange(1, 12))]
+            if rng.random() < 0.2:
+                props["t"] = "\n".join(rng.choice(["", "#000000", "#ff0000"]) for _ in range(rng.randrange(1, 4)))
+            if rng.random() < 0.2:
+                props["w"] = rng.choice([1.25, 1.5, 2, 6.25])
+            if not row:
+                # Rotations can only change at the start of a row
+                if rng.random() < 0.2:
+                    props["r"] = rng.choice([-30, 0, 10, 45])
+                if rng.random() < 0.2:
+                    props["rx"] = rng.randrange(0, 10)
+                if rng.random() < 0.2:
+                    props["ry"] = rng.randrange(0, 10)
+            if rng.random() < 0.1:
+                props["x"] = rng.choice([0.25, 0.5, 1])
+            if props:
+                row.append(props)
+            row.append("\n".join(rng.choice(["", "A", "1", "Shift"]) for _ in range(rng.randrange(1, 12))))
+        rows.append(row)
+    return rows
+
+@pytest.mark.parametrize("rows", LAYOUTS)
+def test_deserialize_matches_legacy(rows):
+    assert serial.deserialize(deepcopy(rows)) == legacy_serial.deserialize(deepcopy(rows))
+
+def test_deserialize_matches_legacy_on_random_layouts():
+    rng = random.Random(0)
+    for _ in range(300):
+        rows = random_layout(rng)
+        assert serial.deserialize(deepcopy(rows)) == legacy_serial.deserialize(deepcopy(rows)), rows
+
+def test_deserialize_errors_like_legacy():
+    rows = [["1", {"rx": 1}, "2"]]
+    with pytest.raises(ValueError) as legacy:
+        legacy_serial.deserialize(deepcopy(rows))
+    with pytest.raises(ValueError) as current:
+        serial.deserialize(deepcopy(rows))
+    assert str(current.value) == str(legacy.value)
+
+def test_deserialized_keys_dont_share_lists():
+    kbd = serial.deserialize(deepcopy(LAYOUTS[0]))
+    first, second = kbd.keys[0], kbd.keys[1]
+    first.labels[0] = "changed"
+    first.text_color[0] = "changed"
+    first.text_size[0] = 99
+    assert second.labels[0] != "changed"
+    assert second.text_color[0] != "changed"
+    assert second.text_size[0] != 99
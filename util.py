@@ -1,4 +1,5 @@
-from .serial import Keyboard
+from .serial import Keyboard, deserialize
+from .raw_data import layout_rows
 
 # Gets the bottom right coordinate of bounding box of a cluster of keys
 def max_x_y(keys: list) -> float:
@@ -29,6 +30,10 @@ def read_file(path: str):
     with open(path, 'r', encoding='utf-8') as file:
         return file.read()
 
+def parse_layout(text: str) -> Keyboard:
+    """Parses a KLE saved either as the json download or as the editor's raw data (see `raw_data.layout_rows`)."""
+    return deserialize(layout_rows(text))
+
 def write_file(path: str, content:str):
     with open(path, 'w', encoding='utf-8') as file:
         return file.write(content)
@@ -36,9 +41,5 @@ def write_file(path: str, content:str):
 def sort_keys_kle_placer(keys):
     keys.sort(key=lambda k: ((k.rotation_angle + 360) % 360, k.rotation_x, k.rotation_y, k.y, (k.x + k.width / 2)))
 
-def check_multilayout_keys(kbd: Keyboard) -> bool:
-    keys = []
-    for key in kbd.keys:
-        if key.labels[3].isnumeric() and key.labels[5].isnumeric():
-            keys.append(key)
-    return keys
+def is_multilayout_key(key) -> bool:
+    return key.labels[3].isnumeric() and key.labels[5].isnumeric()
@@ -0,0 +1,159 @@
+from .util import is_multilayout_key
+from .placement import extra_switch_rotation
+
+# Maximum number of keys or references listed in a single problem, the rest are only counted
+MAX_LISTED = 10
+
+class ValidationError(Exception):
+    """Raised with every problem found before placing, nothing on the board has been changed when it is raised."""
+    def __init__(self, problems: list):
+        self.problems = list(problems)
+        super().__init__("Found {} problem(s), nothing was moved:\n{}".format(len(self.problems), "\n".join("- " + problem for problem in self.problems)))
+
+def describe_key(key) -> str:
+    return "'{}' at ({}, {})".format(key.labels[0], key.x, key.y) if key.labels[0] else "({}, {})".format(key.x, key.y)
+
+def summarize(items: list) -> str:
+    listed = ", ".join(items[:MAX_LISTED])
+    if len(items) > MAX_LISTED:
+        listed += " and {} more".format(len(items) - MAX_LISTED)
+    return listed
+
+def check_multilayouts(keys: list) -> list:
+    """Checks that every multilayout of parsed keys has a default value/option, which they are squished onto.
+    This is the only check that can't wait until the keys are squished, see `layout.prepare_keys`.
+    """
+    problems = []
+    values = {} # multilayout index -> values/options
+    for key in keys:
+        if is_multilayout_key(key):
+            values.setdefault(int(key.labels[3]), set()).add(int(key.labels[5]))
+
+    for ml_ndx, ml_vals in sorted(values.items()):
+        if any(ml_val > 0 for ml_val in ml_vals) and 0 not in ml_vals:
+            problems.append("Multilayout {} has no default value/option (0)".format(ml_ndx))
+    return problems
+
+def check_keys(keys: list, rotation_mode: bool, auto_match: bool = False) -> list:
+    """Checks the squished keys that will be placed: incomplete multilayout labels (3 and 5), references (label 4), rotations
+    and extra switch rotations (label 10). With `auto_match` the keys get their references from the switches nearest to them,
+    so label 4 isn't checked.
+    """
+    problems = []
+
+    # Keys with only one of the labels aren't squished as multilayout keys, so they are all still here
+    incomplete = [describe_key(key) for key in keys
+                  if key.labels[3].isnumeric() != key.labels[5].isnumeric() and not (key.labels[3] and key.labels[5])]
+    if incomplete:
+        problems.append("Keys with only one of the multilayout index (label 3) and value (label 5): {}".format(summarize(incomplete)))
+
+    if rotation_mode and not auto_match:
+        unreferenced = [describe_key(key) for key in keys if not key.labels[4].isdigit()]
+        if unreferenced:
+            problems.append("You need to provide a reference for every switch (label 4) if using rotation mode! Missing on: {}".format(summarize(unreferenced)))
+
+        seen = set()
+        duplicates = []
+        for key in keys:
+            if key.labels[4].isdigit():
+                if key.labels[4] in seen and key.labels[4] not in duplicates:
+                    duplicates.append(key.labels[4])
+                seen.add(key.labels[4])
+        if duplicates:
+            problems.append("Switch references (label 4) used by more than one key: {}".format(summarize(duplicates)))
+    elif not auto_match and any(key.rotation_angle != 0 for key in keys):
+        problems.append("You must enable rotation mode if there are any rotated keys!")
+
+    # Only whole, positive numbers of degrees are used, anything else would be silently ignored
+    bad_rotations = [describe_key(key) for key in keys if key.labels[10] and extra_switch_rotation(key) == 0 and key.labels[10] != "0"]
+    if bad_rotations:
+        problems.append("Extra switch rotations (label 10) that aren't a whole number of degrees: {}".format(summarize(bad_rotations)))
+
+    return problems
+
+def key_numbers(keys: list, rotation_mode: bool, first_number: int = 1) -> list:
+    """Reference numbers of the switches of `keys` that have one, in the same order as the keys: label 4 in Specific
+    Reference Mode, otherwise numbered from `first_number` in the layout's order.
+    """
+    if rotation_mode:
+        return [int(key.labels[4]) for key in keys if key.labels[4].isdigit()]
+    return list(range(first_number, first_number + len(keys)))
+
+def check_references(index, required: list, used: list = None) -> list:
+    """Checks that every `required` reference is on the board (see `FootprintIndex`), and that none of the `used` ones
+    (by default the required ones) are on more than one footprint.
+    """
+    problems = []
+    missing = index.missing(required)
+    if missing:
+        problems.append("Cannot find footprints: {}".format(summarize(missing)))
+
+    used = set(required if used is None else used)
+    duplicates = [reference for reference in dict.fromkeys(index.duplicates) if reference in used]
+    if duplicates:
+        problems.append("References used by more than one footprint: {}".format(summarize(duplicates)))
+    return problems
+
+def check_footprints(index, numbers: list, key_format: str, stabilizer_format: str, diode_format: str, move_diodes: bool, relative_diode_mode: bool,
+                     pairing=None, companion_formats=()) -> list:
+    """Checks that every footprint the placer needs is on the board exactly once.
+    With a `pairing.Pairing`, the diodes, stabilizers and companions are the ones paired with the switches instead of the ones with the same number.
+    """
+    first_key = key_format.format(1)
+    switches = list(dict.fromkeys([first_key] + [key_format.format(number) for number in numbers]))
+    if pairing is not None:
+        stabilizers = list(pairing.stabilizers.values())
+        diodes = list(pairing.diodes.values())
+        companions = [reference for companion_format in companion_formats for reference in pairing.companions.get(companion_format, {}).values()]
+    else:
+        stabilizers = [stabilizer_format.format(number) for number in numbers]
+        diodes = [diode_format.format(number) for number in numbers]
+        companions = [companion_format.format(number) for companion_format in companion_formats for number in numbers]
+    used = switches + stabilizers + (diodes if move_diodes else []) + companions
+    problems = check_references(index, switches, used)
+
+    if move_diodes or relative_diode_mode:
+        if pairing is None and diode_format.format(1) not in index.footprints:
+            problems.append("First key requires a diode! Cannot find {}".format(diode_format.format(1)))
+        elif pairing is not None and first_key not in pairing.diodes:
+            problems.append("First key requires a diode! No diode was paired with {}".format(first_key))
+
+    # Companions are placed relative to the first key's, like diodes
+    for companion_format in companion_formats:
+        if pairing is None and companion_format.format(1) not in index.footprints:
+            problems.append("First key requires a companion for every companion format! Cannot find {}".format(companion_format.format(1)))
+        elif pairing is not None and first_key not in pairing.companions.get(companion_format, {}):
+            problems.append("First key requires a companion for every companion format! No {} was paired with {}".format(companion_format, first_key))
+
+    return problems
+
+def check_matches(keys: list, numbers: list, index, key_format: str) -> list:
+    """Checks the switch numbers keys were matched to with auto-matching (None for keys left without a switch)."""
+    problems = []
+    unmatched = [describe_key(key) for key, number in zip(keys, numbers) if number is None]
+    if unmatched:
+        problems.append("There are fewer switch footprints than keys, no switch was left to match to: {}".format(summarize(unmatched)))
+
+    # The first switch sets the origin and rotation of the whole layout, so it has to be on one of the keys
+    first_key = key_format.format(1)
+    if first_key in index.footprints and 1 not in numbers:
+        problems.append("{} isn't the nearest switch of any key, move it closer to the key it belongs to".format(first_key))
+    return problems
+
+def validate_placement(keys: list, index, key_format: str, stabilizer_format: str, diode_format: str, move_diodes: bool,
+                       relative_diode_mode: bool, rotation_mode: bool, first_number: int = 1, matched_numbers: list = None, pairing=None,
+                       companion_formats=()) -> list:
+    """Runs every check on prepared keys and the board's footprints, returning all problems found (empty if placement can go ahead).
+    `matched_numbers` are the switch numbers of the keys when they were matched to switches by position (see `KeyPlacer.match_keys`),
+    `pairing` the diodes, stabilizers and companions paired with the switches (see `KeyPlacer.pair_footprints`).
+    """
+    auto_match = matched_numbers is not None
+    problems = check_keys(keys, rotation_mode, auto_match)
+    if auto_match:
+        problems += check_matches(keys, matched_numbers, index, key_format)
+        numbers = [number for number in matched_numbers if number is not None]
+    else:
+        numbers = key_numbers(keys, rotation_mode, first_number)
+    problems += check_footprints(index, numbers, key_format, stabilizer_format, diode_format, move_diodes, relative_diode_mode, pairing,
+                                 companion_formats)
+    return problems